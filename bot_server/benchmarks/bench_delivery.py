@@ -0,0 +1,172 @@
+"""
+Сравнение отдачи артефакта: Starlette FileResponse против ArtifactResponse (mmap).
+
+Два прогона:
+- в процессе: ответы вызываются напрямую как ASGI-приложения, send один раз
+  копирует тело. Сокета нет — это только CPU приложения на подготовку тела
+  (чтение файла против срезов mmap), а не скорость отдачи клиентам;
+- uvicorn: те же ответы за настоящим uvicorn в отдельном процессе, клиенты
+  читают их через сокет localhost. Здесь видна пропускная способность и CPU
+  сервера целиком, вместе с записью в сокет.
+
+Запуск из bot_server:
+    python -m benchmarks.bench_delivery --size-mb 64 --requests 16
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from fastapi.responses import FileResponse
+
+from utils.delivery import ArtifactCache, ArtifactResponse
+
+
+def make_scope(range_header=None):
+    headers = [(b"host", b"bench")]
+    if range_header:
+        headers.append((b"range", range_header.encode()))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/download_client",
+        "query_string": b"",
+        "headers": headers,
+        "extensions": {},
+    }
+
+
+async def receive():
+    # Клиент не отключается: ждём, пока ответ не отменит наблюдателя
+    await asyncio.Event().wait()
+
+
+async def serve(make_response, requests, range_header):
+    sent = 0
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(bytes(message.get("body", b"")))
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    await asyncio.gather(*(make_response()(make_scope(range_header), receive, send)
+                           for _ in range(requests)))
+    return sent, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run_server(path, port, conn):
+    """Процесс uvicorn с обоими вариантами ответа; по запросу из conn отдаёт своё CPU-время."""
+    import uvicorn
+    from fastapi import FastAPI
+
+    cache = ArtifactCache()
+    app = FastAPI()
+    app.get("/file")(lambda: FileResponse(path, filename="artifact.bin"))
+    app.get("/artifact")(lambda: ArtifactResponse(path, filename="artifact.bin", cache=cache))
+
+    def answer_cpu():
+        while conn.recv() is not None:
+            conn.send(time.process_time())
+
+    threading.Thread(target=answer_cpu, daemon=True).start()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="critical")
+
+
+def fetch(url, range_header):
+    headers = {"Range": range_header} if range_header else {}
+    received = 0
+    with requests.get(url, headers=headers, stream=True, timeout=(5, 120)) as r:
+        for chunk in r.iter_content(1024 * 1024):
+            received += len(chunk)
+    return received
+
+
+def serve_socket(url, conn, requests_count, range_header):
+    conn.send("cpu")
+    cpu = conn.recv()
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(requests_count) as pool:
+        sent = sum(pool.map(lambda _: fetch(url, range_header), range(requests_count)))
+    wall = time.perf_counter() - wall
+    conn.send("cpu")
+    return sent, wall, conn.recv() - cpu
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.head(f"{base_url}/artifact", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise TimeoutError("uvicorn не запустился")
+
+
+def report(name, sent, wall, cpu):
+    gb = sent / 1024 ** 3
+    print(f"  {name:<18} {sent / 1024 ** 2 / wall:10.0f} MiB/s {cpu / gb:10.3f} CPU s/GiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=16, help="одновременных загрузок")
+    parser.add_argument("--range", dest="range_header", default=None, help='например "bytes=0-1048575"')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "artifact.bin")
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+        cache = ArtifactCache()
+        cases = {
+            "FileResponse": lambda: FileResponse(path, filename="artifact.bin"),
+            "ArtifactResponse": lambda: ArtifactResponse(path, filename="artifact.bin", cache=cache),
+        }
+        print(f"{args.requests} загрузок по {args.size_mb} MiB, range={args.range_header}")
+        print("в процессе, без сокета (только CPU приложения на подготовку тела):")
+        for name, make_response in cases.items():
+            # Прогрев: файл в page cache, mmap уже создан
+            asyncio.run(serve(make_response, 1, args.range_header))
+            report(name, *asyncio.run(serve(make_response, args.requests, args.range_header)))
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        server = ctx.Process(target=run_server, args=(path, port, child_conn), daemon=True)
+        server.start()
+        try:
+            wait_server(base_url)
+            print("uvicorn, сокет localhost (CPU процесса сервера):")
+            for name, route in (("FileResponse", "file"), ("ArtifactResponse", "artifact")):
+                url = f"{base_url}/{route}"
+                fetch(url, args.range_header)
+                report(name, *serve_socket(url, parent_conn, args.requests, args.range_header))
+        finally:
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
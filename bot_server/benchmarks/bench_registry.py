@@ -0,0 +1,65 @@
+"""
+Память и скорость ConnectionRegistry на десятках тысяч сессий.
+
+Сокеты заменены пустыми объектами: замеряется только сам реестр — записи
+Session, индексы по тегу и версии. Память считается через tracemalloc
+и сравнивается с оценкой registry.memory_usage().
+
+Запуск из bot_server:
+    python -m benchmarks.bench_registry --sessions 50000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from utils.registry import ConnectionRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--versions", type=int, default=5)
+    parser.add_argument("--tags", type=int, default=20, help="разных тегов в парке")
+    args = parser.parse_args()
+
+    # Строки client_id и тегов создаются заранее: в проде они приходят из запроса
+    client_ids = [f"{i:08x}-0000-5000-8000-000000000000" for i in range(args.sessions)]
+    tag_lists = [f"site-{i % args.tags},group-{i % 3}" for i in range(args.sessions)]
+    sockets = [object() for _ in range(args.sessions)]
+
+    registry = ConnectionRegistry()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i, client_id in enumerate(client_ids):
+        registry.register(client_id, sockets[i], str(i % args.versions), tag_lists[i])
+    register_time = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i, client_id in enumerate(client_ids):
+        registry.register(client_id, sockets[i], str(i % args.versions), tag_lists[i])
+    evict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for client_id in client_ids:
+        registry.get(client_id)
+    get_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected = len(registry.by_tag("site-0"))
+    tag_time = time.perf_counter() - start
+
+    n = args.sessions
+    print(f"{n} сессий, {len(registry.versions())} версий, {len(registry.tags())} тегов")
+    print(f"память (tracemalloc)   {traced / n:8.0f} байт/сессия  {traced / 1024 ** 2:8.1f} MiB")
+    print(f"memory_usage()         {registry.memory_usage() / n:8.0f} байт/сессия")
+    print(f"register               {register_time / n * 1e6:8.2f} мкс")
+    print(f"повторный (вытеснение) {evict_time / n * 1e6:8.2f} мкс")
+    print(f"get                    {get_time / n * 1e6:8.2f} мкс")
+    print(f"by_tag (site-0)        {tag_time * 1e3:8.2f} мс на {selected} сессий")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Стоимость подписи метаданных: RSA-4096 PKCS1v15 против Ed25519.
+
+Замеряется разбор PEM (старт loader, подпись без кэша ключа), подпись
+на сервере и проверка на loader для типичных данных — hex sha256 и манифеста.
+
+Запуск из bot_server:
+    python -m benchmarks.bench_signatures --iterations 200
+"""
+
+import argparse
+import json
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding, rsa
+
+
+def per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def schemes():
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=4096)
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+    return {
+        "RSA-4096": (
+            rsa_key,
+            lambda key, data: key.sign(data, padding.PKCS1v15(), hashes.SHA256()),
+            lambda key, sig, data: key.verify(sig, data, padding.PKCS1v15(), hashes.SHA256()),
+        ),
+        "Ed25519": (
+            ed_key,
+            lambda key, data: key.sign(data),
+            lambda key, sig, data: key.verify(sig, data),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    n = args.iterations
+    data = json.dumps({"artifacts": [{"sha256": "ab" * 32, "size": 12345678}] * 2}).encode()
+
+    print(f"{'схема':<10} {'разбор priv':>12} {'разбор pub':>11} {'подпись':>10} {'проверка':>10}  (мкс)")
+    for name, (key, sign, verify) in schemes().items():
+        priv_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption())
+        pub_pem = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                serialization.PublicFormat.SubjectPublicKeyInfo)
+        public_key = key.public_key()
+        signature = sign(key, data)
+        results = (
+            per_call(lambda: serialization.load_pem_private_key(priv_pem, password=None), max(1, n // 10)),
+            per_call(lambda: serialization.load_pem_public_key(pub_pem), n),
+            per_call(lambda: sign(key, data), n),
+            per_call(lambda: verify(public_key, signature, data), n),
+        )
+        print(f"{name:<10} {results[0]:12.0f} {results[1]:11.0f} {results[2]:10.0f} {results[3]:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Нагрузочный стенд пути обновления: routes/files.py под потоком loader'ов.
+
+Сервер раздачи (publisher + files router, без бота и БД) запускается отдельным
+процессом на синтетическом каталоге сборок, поэтому его процессорное время
+меряется отдельно от клиентов. N имитированных loader'ов в потоках:
+- опрашивают /manifest с If-None-Match, как loader между обновлениями;
+- скачивают клиент с нуля функцией loader fetch_artifact (сжатый поток с докачкой);
+- обновляются на следующую сборку от локальной копии предыдущей — тем же
+  fetch_artifact, то есть по bsdiff-патчу или чанкам, как настоящий loader.
+Подпись манифеста и sha256 файла проверяются функциями loader/main.py.
+
+Для каждого размера артефакта выводятся RPS, p50/p99 задержки, CPU сервера
+на загрузку и скорость хэширования/проверки подписи на стороне loader.
+
+Запуск из bot_server:
+    python -m benchmarks.bench_update_path --loaders 50 --sizes-mb 1 16 64
+"""
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+ROOT = Path(__file__).resolve().parents[2]
+SETTINGS_PATH = ROOT / "bot_server" / "settings.json"
+LOADER_PATH = ROOT / "loader" / "main.py"
+# Заглушки для bot/config.py: files router берёт из bot.service.loader только logger
+BOT_ENV = {"BOT_TOKEN": "123456:bench", "DB_USERNAME": "bench", "DB_PASSWORD": "bench",
+           "DB_NAME": "bench", "ADMIN_ID": "1"}
+
+
+def run_server(settings_path, port, conn):
+    """Процесс сервера: публикация сборок и files router; по запросу из conn отдаёт своё CPU-время."""
+    os.environ["BOT_SERVER_SETTINGS"] = str(settings_path)
+    for key, value in BOT_ENV.items():
+        os.environ.setdefault(key, value)
+    # Логи сервера пишутся в текущий каталог — уводим их во временный
+    os.chdir(Path(settings_path).parent)
+
+    import asyncio
+    import logging
+    from contextlib import asynccontextmanager
+
+    import uvicorn
+    from fastapi import FastAPI
+
+    from routes.files import router
+    from utils.publisher import publisher
+
+    logging.getLogger("bot_server").setLevel(logging.WARNING)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        task = asyncio.create_task(publisher.run())
+        yield
+        task.cancel()
+
+    def answer_cpu():
+        while conn.recv() is not None:
+            conn.send(time.process_time())
+
+    threading.Thread(target=answer_cpu, daemon=True).start()
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="critical")
+
+
+def load_loader(pub_pem, ed25519_pub_pem, tmp):
+    """loader/main.py как модуль с ключами стенда; свои файлы он пишет в tmp."""
+    spec = importlib.util.spec_from_file_location("bench_loader", LOADER_PATH)
+    loader = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(loader)
+    # Отказы губернатора (503) стенд считает сам, предупреждения о них не нужны
+    loader.logger.setLevel("ERROR")
+    loader.PUB_KEY_PEM = pub_pem
+    loader.ED25519_PUB_KEY_PEM = ed25519_pub_pem
+    loader.HASH_CACHE_PATH = tmp / "loader.hashes.json"
+    # Отказ губернатора считается, но стенд не ждёт полный Retry-After
+    loader.MAX_RETRY_AFTER = 0
+    loader.DOWNLOAD_RETRY = loader.RetryPolicy(attempts=100, base_delay=0.2, max_delay=0.2)
+    return loader
+
+
+def make_keys(tmp, use_ed25519):
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=4096)
+    (tmp / "sign_priv.pem").write_bytes(rsa_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    pub = rsa_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    if not use_ed25519:
+        return pub, None
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+    (tmp / "sign_ed25519.pem").write_bytes(ed_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    ed_pub = ed_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return pub, ed_pub
+
+
+def write_settings(tmp, max_concurrent):
+    """Настройки репозитория с каталогами, ключами и раскаткой стенда."""
+    settings = json.loads(SETTINGS_PATH.read_text(encoding="utf-8"))
+    settings["build"].update(
+        build_dir=str(tmp / "build"), store_dir=str(tmp / "published"),
+        sign_priv_path=str(tmp / "sign_priv.pem"),
+        sign_ed25519_priv_path=str(tmp / "sign_ed25519.pem"),
+        watch_poll_interval=0.2, watch_settle_delay=0.2,
+    )
+    # Без поэтапной раскатки: все loader'ы получают одну и ту же версию
+    settings.setdefault("rollout", {})["steps"] = [100]
+    if max_concurrent is not None:
+        settings.setdefault("downloads", {})["max_concurrent"] = max_concurrent
+    path = tmp / "settings.json"
+    path.write_text(json.dumps(settings, indent=4), encoding="utf-8")
+    (tmp / "build").mkdir(exist_ok=True)
+    return path, settings
+
+
+def write_artifact(path, size):
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(remaining, 1024 * 1024))
+            f.write(block)
+            remaining -= len(block)
+
+
+def write_next_build(path, base_copy):
+    """Следующая сборка: копия текущей с изменённым блоком посередине, прежняя — в base_copy."""
+    shutil.copyfile(path, base_copy)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.seek(size // 2)
+        f.write(os.urandom(min(4096, size - size // 2)))
+    # Сборка должна «устояться» для publisher, как после копирования билдом
+    os.utime(path, (time.time() - 5, time.time() - 5))
+
+
+def wait_patch(base_url, from_hash, to_hash, timeout):
+    """Ждёт, пока сервер построит bsdiff-патч; False — не успел (обновление пойдёт чанками)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            r = requests.get(f"{base_url}/client_patch", params={"from": from_hash, "to": to_hash},
+                             timeout=5)
+            if r.status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_published(base_url, loader, client_file, expected_hash, timeout=600):
+    """Ждёт, пока сервер не начнёт раздавать клиент с нужным sha256."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            data = requests.get(f"{base_url}/manifest", timeout=5).json()
+            # До первой публикации сервер отвечает ошибкой, а не манифестом
+            if "manifest" in data:
+                entries = loader.parse_signed_manifest(data) or {}
+                if entries.get("client", {}).get("sha256") == expected_hash:
+                    return data
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{client_file} не опубликован за {timeout} с")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        # (проверка манифеста, хэширование файла в секундах, размер файла) по загрузкам
+        self.checks = []
+        self._lock = threading.Lock()
+
+    def add(self, latency, status):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def check(self, manifest_time, hash_time, size):
+        with self._lock:
+            self.checks.append((manifest_time, hash_time, size))
+
+
+def poll_worker(base_url, client_id, deadline, stats):
+    """Loader между обновлениями: условный /manifest без long-poll."""
+    session = requests.Session()
+    etag = None
+    while time.monotonic() < deadline:
+        headers = {"If-None-Match": etag} if etag else {}
+        start = time.perf_counter()
+        try:
+            r = session.get(f"{base_url}/manifest", params={"client_id": client_id},
+                            headers=headers, timeout=30)
+        except requests.RequestException:
+            stats.error()
+            continue
+        stats.add(time.perf_counter() - start, r.status_code)
+        etag = r.headers.get("ETag") or etag
+
+
+def download_worker(client_id, loader, download_dir, stats, base_path=None):
+    """
+    Обновление клиента кодом loader: подписанный манифест, затем fetch_artifact —
+    патч от base_path, чанки или сжатый поток с докачкой; в конце проверка sha256.
+    """
+    tmp_path = os.path.join(download_dir, f"{client_id}.part")
+    start = time.perf_counter()
+    try:
+        r = loader.transport.get("/manifest", params={"client_id": client_id})
+        manifest_verify = time.perf_counter()
+        entry = loader.parse_signed_manifest(r.json())["client"]
+        manifest_verify = time.perf_counter() - manifest_verify
+        if not loader.fetch_artifact(entry, tmp_path, base_path=base_path):
+            stats.error()
+            return
+        latency = time.perf_counter() - start
+        hash_time = time.perf_counter()
+        ok = loader.compute_file_hash(tmp_path) == entry["sha256"]
+        hash_time = time.perf_counter() - hash_time
+        if not ok:
+            stats.error()
+            return
+        stats.add(latency, 200)
+        stats.check(manifest_verify, hash_time, entry["size"])
+    except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError):
+        stats.error()
+    finally:
+        loader.discard_part(tmp_path)
+
+
+def server_cpu(conn):
+    conn.send("cpu")
+    return conn.recv()
+
+
+def report(phase, stats, wall):
+    ok = [lat for lat in stats.latencies if lat > 0]
+    statuses = " ".join(f"{code}:{count}" for code, count in sorted(stats.statuses.items()))
+    print(f"  {phase:<9} {len(stats.latencies) / wall:9.1f} RPS  p50 {percentile(ok, 50) * 1e3:8.2f} ms"
+          f"  p99 {percentile(ok, 99) * 1e3:8.2f} ms  [{statuses}] ошибок: {stats.errors}")
+
+
+def run_downloads(phase, args, tmp, loader, parent_conn, size_mb, pub_keys, base_path=None):
+    """Волна обновлений loader'ов: задержки, отказы губернатора, CPU сервера и проверка на loader."""
+    stats = Stats()
+
+    def count_busy(resp, *args, **kwargs):
+        if resp.status_code == 503:
+            stats.add(0.0, 503)
+
+    loader.transport.session.hooks["response"] = [count_busy]
+    download_dir = tmp / "downloads"
+    download_dir.mkdir(exist_ok=True)
+    cpu = server_cpu(parent_conn)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.loaders) as pool:
+        for i in range(args.loaders * args.rounds):
+            pool.submit(download_worker, f"bench-{i}", loader, str(download_dir), stats, base_path)
+    wall = time.perf_counter() - start
+    download_cpu = server_cpu(parent_conn) - cpu
+    loader.transport.session.hooks["response"] = []
+    verify = stats.checks
+    downloads = max(len(verify), 1)
+    report(phase, stats, wall)
+    print(f"  CPU сервера: {download_cpu / downloads * 1e3:.1f} мс/загрузка, "
+          f"{download_cpu / (downloads * size_mb / 1024):.3f} CPU s/GiB")
+    if verify:
+        manifest_us = sum(v[0] for v in verify) / len(verify) * 1e6
+        hash_rate = sum(v[2] for v in verify) / max(sum(v[1] for v in verify), 1e-9) / 1024 ** 2
+        print(f"  loader: проверка манифеста {manifest_us:.0f} мкс ({pub_keys}), "
+              f"sha256 {hash_rate:.0f} MiB/s")
+
+
+def bench_size(size_mb, args, tmp, settings, loader, pub_keys):
+    build_dir = Path(settings["build"]["build_dir"])
+    client_path = build_dir / settings["build"]["build_client_file"]
+    write_artifact(client_path, size_mb * 1024 * 1024)
+    write_artifact(build_dir / settings["build"]["build_loader_file"], 64 * 1024)
+    expected = loader.compute_file_hash(client_path)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    server = ctx.Process(target=run_server, args=(tmp / "settings.json", port, child_conn), daemon=True)
+    server.start()
+    # Транспорт loader на сервер этого прогона: одна keep-alive сессия на всех, как пул потоков
+    loader.transport = loader.Transport(base_url, pool_size=args.loaders * loader.PARALLEL_DOWNLOADS)
+    try:
+        wait_published(base_url, loader, client_path.name, expected)
+        print(f"{size_mb} MiB, loader'ов: {args.loaders}")
+
+        stats = Stats()
+        cpu = server_cpu(parent_conn)
+        start = time.perf_counter()
+        deadline = time.monotonic() + args.poll_seconds
+        with ThreadPoolExecutor(args.loaders) as pool:
+            for i in range(args.loaders):
+                pool.submit(poll_worker, base_url, f"bench-{i}", deadline, stats)
+        wall = time.perf_counter() - start
+        poll_cpu = server_cpu(parent_conn) - cpu
+        report("опрос", stats, wall)
+        print(f"  CPU сервера: {poll_cpu / max(len(stats.latencies), 1) * 1e6:.0f} мкс/запрос")
+
+        run_downloads("загрузка", args, tmp, loader, parent_conn, size_mb, pub_keys)
+
+        base_copy = tmp / f"previous-{client_path.name}"
+        write_next_build(client_path, base_copy)
+        updated = loader.compute_file_hash(client_path)
+        wait_published(base_url, loader, client_path.name, updated)
+        patch_ready = wait_patch(base_url, expected, updated, args.patch_wait)
+        patchable = size_mb * 1024 * 1024 <= loader.MAX_PATCH_FILE_SIZE
+        print(f"  обновление: {'bsdiff-патч' if patch_ready and patchable else 'чанки'} "
+              f"от предыдущей сборки")
+        run_downloads("обновл.", args, tmp, loader, parent_conn, size_mb, pub_keys,
+                      base_path=str(base_copy))
+        os.remove(base_copy)
+    finally:
+        loader.transport.close()
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--loaders", type=int, default=50, help="одновременных loader'ов")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--poll-seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=1, help="загрузок на loader")
+    parser.add_argument("--patch-wait", type=float, default=120,
+                        help="сколько ждать bsdiff-патч на сервере, секунд")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="downloads.max_concurrent (0 — без лимита), по умолчанию из settings.json")
+    parser.add_argument("--ed25519", action="store_true", help="подписывать манифест и Ed25519")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_update_"))
+    try:
+        pub, ed_pub = make_keys(tmp, args.ed25519)
+        _, settings = write_settings(tmp, args.max_concurrent)
+        loader = load_loader(pub, ed_pub, tmp)
+        pub_keys = "Ed25519" if args.ed25519 else "RSA-4096"
+        for size_mb in args.sizes_mb:
+            bench_size(size_mb, args, tmp, settings, loader, pub_keys)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from .db_engine import create_pool
-from .models import TABLES_SQL
+from .models import SCHEMA_LOCK_ID, TABLES_SQL
 
 
 class Database:
@@ -23,8 +23,11 @@ class Database:
     async def create_tables(self):
         """Создаёт все таблицы из models.TABLES_SQL."""
         async with self.pool.acquire() as conn:
-            for query in TABLES_SQL:
-                await conn.execute(query)
+            async with conn.transaction():
+                # Воркеры стартуют одновременно: CREATE ... IF NOT EXISTS сам по себе гонки не переживает
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+                for query in TABLES_SQL:
+                    await conn.execute(query)
 
     async def clear_all_tables(self):
         """Очищает все таблицы в бд."""
@@ -12,5 +12,6 @@ async def create_pool():
         host='127.0.0.1',
         port='5432',
         min_size=1,
-        max_size=5
+        # Два соединения постоянно заняты кластером: LISTEN и блокировка Telegram-поллера
+        max_size=7
     )
@@ -1,3 +1,6 @@
+# Ключ advisory lock на время создания таблиц
+SCHEMA_LOCK_ID = 0x52504330
+
 TABLES_SQL = [
     """
     CREATE TABLE IF NOT EXISTS users (
@@ -5,5 +8,24 @@ TABLES_SQL = [
         client_id TEXT UNIQUE NOT NULL,
         name TEXT UNIQUE
     );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cluster_workers (
+        worker TEXT PRIMARY KEY,
+        heartbeat TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    # Кто из воркеров держит сокет клиента; после перезапуска БД содержимое не нужно
+    """
+    CREATE UNLOGGED TABLE IF NOT EXISTS cluster_clients (
+        client_id TEXT PRIMARY KEY,
+        worker TEXT NOT NULL,
+        version TEXT,
+        tags TEXT[] NOT NULL DEFAULT '{}',
+        connected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS cluster_clients_worker ON cluster_clients (worker);
     """
 ]
\ No newline at end of file
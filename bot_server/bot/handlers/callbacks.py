@@ -5,9 +5,12 @@ from aiogram.types import CallbackQuery, Message
 
 from bot.keyboards import inline_markups as kb
 from bot.service.loader import bot
-from routes.websocket import connected_clients
+from utils.cluster import cluster
 
 router = Router()
+# Интерактивные команды обгоняют в очереди клиента обычные (например, open_link)
+URGENT_COMMANDS = {"lock", "shutdown", "reboot"}
+
 
 class OpenLink(StatesGroup):
     link = State()
@@ -27,11 +30,9 @@ async def execute_command(callback: CallbackQuery):
     parts = callback.data.split("_", 2)
     cmd = parts[1]
     client_id = parts[2]
-    client = connected_clients.get(client_id)
-    if not client:
-        return await callback.answer("ПК не подключен", show_alert=True)
     try:
-        await client.send_json({"command": cmd})
+        if not await cluster.send(client_id, {"command": cmd}, urgent=cmd in URGENT_COMMANDS):
+            return await callback.answer("ПК не подключен", show_alert=True)
         await callback.answer(f'Команда "{cmd}" отправлена на ({client_id})')
     except Exception as e:
         await callback.answer(f'Ошибка: {e}', show_alert=True)
@@ -55,11 +56,9 @@ async def check_user_profile(message: Message, state: FSMContext):
     await state.clear()
     client_id = data["client_id"]
     link = data["link"]
-    client = connected_clients.get(client_id)
-    if not client:
-        return await message.answer('ПК не подключен', show_alert=True)
     try:
-        await client.send_json({"command": "open_link", "property": link})
+        if not await cluster.send(client_id, {"command": "open_link", "property": link}):
+            return await message.answer('ПК не подключен', show_alert=True)
         await message.answer(f'Команда "open_link" отправлена на ({client_id})')
     except Exception as e:
         await message.answer(f'Ошибка: {e}', show_alert=True)
@@ -3,8 +3,11 @@ from aiogram.filters.command import Command
 from aiogram.types import Message
 
 from bot.keyboards import inline_markups as kb
+from bot.service import config
 from bot.service.loader import bot, db
-from routes.websocket import connected_clients
+from utils.cluster import cluster
+from utils.publisher import publisher
+from utils.rollout import rollout
 
 router = Router()
 
@@ -17,19 +20,96 @@ async def start(message: Message):
     )
 
 
+async def _selected_clients(message: Message):
+    """/clients [тег | v:версия] — все подключённые или выборка по тегу/версии."""
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        return await cluster.client_ids()
+    selector = parts[1].strip()
+    if selector.startswith("v:"):
+        return await cluster.client_ids(version=selector[2:])
+    return await cluster.client_ids(tag=selector)
+
+
 @router.message(Command(commands=["c", "clients"]))
 async def list_clients(message: Message):
-    if not connected_clients:
+    client_ids = await _selected_clients(message)
+    if not client_ids:
         return await message.reply(
             '❌ Нет подключённых пользователей'
         )
     users = await db.get_users()
     if not users:
         users = ''
+    versions = await cluster.versions()
+    total = sum(versions.values())
+    versions = ', '.join(f'{version or "?"}: {count}' for version, count in versions.items())
     await bot.send_message(
         message.from_user.id,
-        f'Кол-во подключённых пользователей: <code>{len(connected_clients)}</code>.\n'
-        f'Кол-во пользователей в db: <code>{len(users)}</code>.\n\n'
+        f'Кол-во подключённых пользователей: <code>{len(client_ids)}</code> из <code>{total}</code>.\n'
+        f'Кол-во пользователей в db: <code>{len(users)}</code>.\n'
+        f'Версии клиентов: <code>{versions}</code>.\n\n'
         f'Выберите пользователя для управления:',
-        reply_markup=kb.clients(connected_clients).as_markup()
+        reply_markup=kb.clients(client_ids).as_markup()
     )
+
+
+def _is_admin(message: Message):
+    return message.from_user.id in config.ADMIN_IDS or message.from_user.id == config.ADMIN_ID
+
+
+def _rollout_target(message: Message):
+    """Имя артефакта из аргумента команды (по умолчанию client)."""
+    parts = (message.text or "").split(maxsplit=1)
+    name = parts[1].strip() if len(parts) > 1 else "client"
+    return name if name in publisher.artifacts else None
+
+
+@router.message(Command(commands=["rollout"]))
+async def rollout_status(message: Message):
+    if not _is_admin(message):
+        return
+    # Состояние меняют воркеры шлюза при публикации сборок — читаем актуальное
+    await rollout.reload()
+    status = rollout.status()
+    if not status:
+        return await message.reply('Нет опубликованных сборок.')
+    lines = []
+    for name, state in status.items():
+        if state["candidate"]:
+            paused = ' (пауза)' if state["paused"] else ''
+            lines.append(
+                f'<b>{name}</b>: <code>{state["candidate"][:12]}</code> на '
+                f'{state["percent"]}%{paused}, stable <code>{state["stable"][:12]}</code>'
+            )
+        else:
+            lines.append(f'<b>{name}</b>: <code>{state["stable"][:12]}</code> у всех')
+    await message.reply('\n'.join(lines))
+
+
+ROLLOUT_ACTIONS = {
+    "rollout_pause": (rollout.pause, 'Раскатка {name} на паузе.'),
+    "rollout_resume": (rollout.resume, 'Раскатка {name} продолжена.'),
+    "rollout_next": (rollout.advance, 'Раскатка {name} переведена на следующий шаг.'),
+    "rollout_full": (lambda name: rollout.advance(name, full=True), 'Версия {name} раскатана на всех.'),
+    "rollout_abort": (rollout.abort, 'Раскатка {name} отменена, все получают stable.'),
+}
+
+
+@router.message(Command(commands=list(ROLLOUT_ACTIONS)))
+async def rollout_control(message: Message):
+    """/rollout_pause|resume|next|full|abort [client|loader]"""
+    if not _is_admin(message):
+        return
+    name = _rollout_target(message)
+    if name is None:
+        return await message.reply(f'Неизвестный артефакт. Доступны: {", ".join(publisher.artifacts)}.')
+    command = message.text.split(maxsplit=1)[0].lstrip("/").split("@")[0]
+    action, text = ROLLOUT_ACTIONS[command]
+    await rollout.reload()
+    if not action(name):
+        return await message.reply(f'Для {name} нет активной раскатки.')
+    await rollout.flush()
+    await publisher.notify()
+    await cluster.broadcast("rollout")
+    await message.reply(text.format(name=name))
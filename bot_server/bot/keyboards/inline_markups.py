@@ -2,9 +2,9 @@ from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 
-def clients(connected_clients):
+def clients(client_ids):
     kb = InlineKeyboardBuilder()
-    for client_id in connected_clients.keys():
+    for client_id in client_ids:
         kb.add(InlineKeyboardButton(text=client_id, callback_data=f'client_{client_id}'))
     return kb
 
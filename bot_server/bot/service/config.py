@@ -33,6 +33,19 @@ try:
 except Exception:
     PORT = 1337
 
+# Число процессов uvicorn; больше одного — клиенты и команды распределяются через PostgreSQL
+_workers_raw = safe_get_env("WORKERS")
+try:
+    WORKERS = max(int(_workers_raw), 1) if _workers_raw and _workers_raw.isdigit() else 1
+except Exception:
+    WORKERS = 1
+
+# Роль процесса: all — шлюз и бот вместе, gateway — только websocket/HTTP, bot — только Telegram
+ROLE = (safe_get_env("ROLE", "all") or "all").lower()
+if ROLE not in ("all", "gateway", "bot"):
+    print(f"[CONFIG WARNING] Неизвестная ROLE={ROLE}, используется all.")
+    ROLE = "all"
+
 _admin_ids_raw = safe_get_env("ADMIN_IDS", "")
 try:
     ADMIN_IDS = [
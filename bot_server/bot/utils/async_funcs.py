@@ -32,3 +32,11 @@ async def on_client_result(client_id, result_json):
         await bot.send_message(config.ADMIN_ID, message)
     except Exception as e:
         logger.error(f'Ошибка отправки сообщения администратору ({config.ADMIN_ID}): {e}')
+
+
+async def notify_admin(text):
+    """Сообщение администратору от шлюза (новое устройство, crash loop клиента)."""
+    try:
+        await bot.send_message(config.ADMIN_ID, text)
+    except Exception as e:
+        logger.error(f'Ошибка отправки сообщения администратору ({config.ADMIN_ID}): {e}')
@@ -1,13 +1,21 @@
 import asyncio
 from contextlib import asynccontextmanager
+from functools import partial
 
 import uvicorn
 from fastapi import FastAPI
 
 from bot.handlers import callbacks, commands
+from bot.service import config
 from bot.service.loader import bot, db, dp, logger
+from bot.utils.async_funcs import notify_admin, on_client_result
 from routes.files import router as files_router
-from routes.websocket import router as ws_router
+from routes.reports import router as reports_router
+from routes.websocket import router as ws_router, watch_idle
+from utils.cluster import PUBLISHER_LOCK_ID, cluster
+from utils.config_loader import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from utils.publisher import publisher
+from utils.rollout import rollout
 
 
 async def start_bot_safe():
@@ -24,23 +32,77 @@ async def start_bot_safe():
             await asyncio.sleep(5)
 
 
-@asynccontextmanager
-async def lifespan(app):
-    """Современное управление жизненным циклом FastAPI."""
-    bot_task = asyncio.create_task(start_bot_safe())
-    dp.include_router(callbacks.router)
-    dp.include_router(commands.router)
+async def start_bot():
+    """Бот принимает сообщения шлюзов только пока держит блокировку поллера."""
+    await cluster.listen_bot()
+    try:
+        await start_bot_safe()
+    finally:
+        await cluster.unlisten_bot()
+
+
+async def reload_rollout():
+    """Раскатку изменили в другом воркере: перечитываем состояние и будим long-poll."""
+    await rollout.reload()
+    await publisher.notify()
+
+
+async def run_publisher():
+    """Сборки публикует один воркер, остальные подхватывают его версии по рассылке."""
+    await publisher.sync()
+    await cluster.run_exclusive(partial(publisher.run, announce=partial(cluster.broadcast, "publish")),
+                                lock_id=PUBLISHER_LOCK_ID, title="публикация сборок")
+
+
+async def start_services():
+    """БД, шина между процессами и обработчики бота, если он работает в этом процессе."""
     await db.connect()
     # await db.drop_all_tables()
     await db.create_tables()
     logger.info("База данных готова.")
-    logger.info('Telegram бот запущен.')
+    # Шина нужна, когда шлюз и бот в разных процессах или воркеров несколько
+    await cluster.start(db.pool, enabled=config.WORKERS > 1 or config.ROLE != "all")
+    cluster.subscribe("rollout", reload_rollout)
+    cluster.subscribe("publish", publisher.sync)
+    if config.ROLE != "gateway":
+        dp.include_router(callbacks.router)
+        dp.include_router(commands.router)
+        cluster.handle("client_result", on_client_result)
+        cluster.handle("admin_notice", notify_admin)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Современное управление жизненным циклом FastAPI."""
+    rollout_task = asyncio.create_task(publisher.watch_rollout())
+    idle_task = asyncio.create_task(watch_idle())
+    await start_services()
+    publisher_task = asyncio.create_task(run_publisher())
+    bot_task = None
+    if config.ROLE == "all":
+        # Telegram-поллер один на все воркеры
+        bot_task = asyncio.create_task(cluster.run_exclusive(start_bot))
+        logger.info('Telegram бот запущен.')
     yield
-    bot_task.cancel()
+    publisher_task.cancel()
+    rollout_task.cancel()
+    idle_task.cancel()
+    if bot_task is not None:
+        bot_task.cancel()
+        try:
+            await bot_task
+        except asyncio.CancelledError:
+            logger.info('Telegram бот остановлен.')
+    await cluster.stop()
+
+
+async def run_bot_process():
+    """ROLE=bot: только Telegram, команды клиентам уходят шлюзам через шину."""
+    await start_services()
     try:
-        await bot_task
-    except asyncio.CancelledError:
-        logger.info('Telegram бот остановлен.')
+        await cluster.run_exclusive(start_bot)
+    finally:
+        await cluster.stop()
 
 app = FastAPI(
     title='Remote PC Control Server',
@@ -49,14 +111,22 @@ app = FastAPI(
 
 app.include_router(ws_router)
 app.include_router(files_router)
+app.include_router(reports_router)
 
 if __name__ == "__main__":
     try:
-        uvicorn.run(
-            "main:app",
-            host="0.0.0.0",
-            port=1337,
-            log_level="critical"
-        )
+        if config.ROLE == "bot":
+            asyncio.run(run_bot_process())
+        else:
+            uvicorn.run(
+                "main:app",
+                host="0.0.0.0",
+                port=1337,
+                log_level="critical",
+                workers=config.WORKERS,
+                # Ping/pong control frames со стороны сервера: полуоткрытые соединения закрывает uvicorn
+                ws_ping_interval=HEARTBEAT_INTERVAL,
+                ws_ping_timeout=HEARTBEAT_TIMEOUT
+            )
     except Exception as e:
         logger.critical(f'Uvicorn критическая ошибка: {e}')
@@ -1,78 +1,256 @@
-import os
+import asyncio
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
 
 from bot.service.loader import logger
-from utils.config_loader import (BUILD_CLIENT_FILE, CLIENT_PATH, LOADER_PATH,
-                                 LOADER_VERSION, SIGN_PRIV_PATH)
-from utils.tools import compute_file_hash, sign_hash_with_rsa
+from utils.cadence import poll_policy
+from utils.config_loader import (BUILD_CLIENT_FILE, BUILD_LOADER_FILE,
+                                 LONG_POLL_MAX)
+from utils.delivery import ArtifactResponse
+from utils.governor import governor
+from utils.publisher import publisher
 
 router = APIRouter()
 
 
+def _not_found(filename):
+    return JSONResponse({"error": f'{filename} not found'}, status_code=404)
+
+
+def _etag_matches(request: Request, etag):
+    """Слабое сравнение If-None-Match (RFC 9110) с текущим ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in tags
+
+
+def _json_or_304(request: Request, body, etag, poll=True):
+    """Ответ info-эндпоинта: заодно сообщает loader'у, когда опрашивать снова."""
+    headers = {"ETag": etag}
+    if poll:
+        poll_policy.hit()
+        headers.update(poll_policy.headers())
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _long_poll(wait, unchanged):
+    """
+    Long-poll: держит запрос, пока unchanged() истинно (клиент уже знает текущую версию),
+    но не дольше wait секунд. Возвращается сразу после публикации или смены раскатки.
+    """
+    if not wait or wait <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(wait, LONG_POLL_MAX)
+    while True:
+        revision = publisher.revision
+        timeout = deadline - loop.time()
+        if timeout <= 0 or not await unchanged():
+            return
+        await publisher.wait_changed(revision, timeout)
+
+
+def _info_unchanged(request: Request, name, client_id, known):
+    async def unchanged():
+        artifact = publisher.get(name, client_id)
+        if artifact is None:
+            return True
+        if known:
+            return artifact.hash == known
+        return _etag_matches(request, artifact.etag)
+    return unchanged
+
+
+def _negotiate_encoding(request: Request, available):
+    """Лучшее из доступных сжатий по Accept-Encoding (с учётом q) или None."""
+    header = request.headers.get("accept-encoding")
+    if not header or not available or "range" in request.headers:
+        return None
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    best = None
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def _select(name, client_id=None, sha256=None):
+    """Версия для запроса: закреплённая ссылкой из манифеста или выбранная раскаткой."""
+    if sha256:
+        return publisher.version(name, sha256)
+    return publisher.get(name, client_id)
+
+
+def _file_or_304(request: Request, artifact):
+    variants = publisher.variants(artifact)
+    encoding = _negotiate_encoding(request, list(variants))
+    if encoding:
+        path = variants[encoding]
+        etag = f'"{artifact.hash}-{encoding}"'
+        headers = {"ETag": etag, "Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    else:
+        path = artifact.path
+        etag = artifact.etag
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return governor.admit(ArtifactResponse(path, filename=artifact.filename, headers=headers))
+
+
+def _patch_response(request: Request, name, from_hash, to_hash, client_id=None):
+    artifact = publisher.get(name, client_id)
+    if artifact is None:
+        return _not_found(publisher.artifacts[name])
+    to_hash = to_hash or artifact.hash
+    path = publisher.patch_path(name, from_hash, to_hash)
+    if path is None:
+        return JSONResponse({"error": 'patch not available'}, status_code=404)
+    etag = f'"{from_hash}-{to_hash}"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    # Патчи — основной трафик сразу после релиза: под тем же лимитом передач и скорости
+    return governor.admit(ArtifactResponse(path, headers={"ETag": etag, "X-Target-SHA256": to_hash}))
+
+
+@router.get("/manifest")
+async def manifest(request: Request, client_id: str = None, wait: float = 0):
+    """
+    Подписанный манифест всех артефактов — один запрос на цикл проверки loader.
+    С ?wait=N и If-None-Match ответ придёт, как только манифест для клиента изменится.
+    """
+    try:
+        async def unchanged():
+            current = await publisher.manifest(client_id)
+            return current is None or _etag_matches(request, current.etag)
+
+        await _long_poll(wait, unchanged)
+        current = await publisher.manifest(client_id)
+        if current is None:
+            return _not_found("manifest")
+        return _json_or_304(request, current.json, current.etag)
+    except Exception as e:
+        logger.error(f'Ошибка /manifest: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
+
+
 @router.get("/client_info")
-async def client_info():
+async def client_info(request: Request, client_id: str = None, sha256: str = None,
+                      wait: float = 0, known: str = None):
+    """С ?wait=N&known=<hash> ждёт до N секунд, пока опубликованный хэш не сменится."""
     try:
-        if not os.path.exists(CLIENT_PATH):
-            raise HTTPException(status_code=404, detail=f'{BUILD_CLIENT_FILE} not found')
-        file_hash = compute_file_hash(CLIENT_PATH)
-        if not isinstance(file_hash, str):
-            raise ValueError('Хэш файла не удалось вычислить корректно')
-        file_size = os.path.getsize(CLIENT_PATH)
-        signature = sign_hash_with_rsa(SIGN_PRIV_PATH, file_hash.encode())
-        return {
-            "filename": BUILD_CLIENT_FILE,
-            "hash": file_hash,
-            "size": file_size,
-            "signature": signature
-        }
+        if not sha256:
+            await _long_poll(wait, _info_unchanged(request, "client", client_id, known))
+        artifact = _select("client", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_CLIENT_FILE)
+        return _json_or_304(request, artifact.info_json, artifact.etag)
     except Exception as e:
         logger.error(f'Ошибка /client_info: {e}')
         return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
 
 
 @router.get("/download_client")
-async def download_client():
+async def download_client(request: Request, client_id: str = None, sha256: str = None):
     try:
-        if not os.path.exists(CLIENT_PATH):
-            raise HTTPException(status_code=404, detail=f"{BUILD_CLIENT_FILE} not found")
-        return FileResponse(CLIENT_PATH, filename=BUILD_CLIENT_FILE)
+        artifact = _select("client", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_CLIENT_FILE)
+        return _file_or_304(request, artifact)
     except Exception as e:
         logger.error(f'Ошибка /download_client: {e}')
         return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
 
 
 @router.get("/loader_info")
-def loader_info():
+async def loader_info(request: Request, client_id: str = None, sha256: str = None,
+                      wait: float = 0, known: str = None):
+    """С ?wait=N&known=<hash> ждёт до N секунд, пока опубликованный хэш не сменится."""
     try:
-        if not os.path.exists(LOADER_PATH):
-            raise HTTPException(status_code=404, detail='loader not found')
-        file_hash = compute_file_hash(LOADER_PATH)
-        if not isinstance(file_hash, str):
-            raise ValueError('Хэш loader не удалось вычислить')
-        size = os.path.getsize(LOADER_PATH)
-        with open(SIGN_PRIV_PATH, "rb") as f:
-            priv_key_data = f.read()
-        signature = sign_hash_with_rsa(priv_key_data, file_hash.encode())
-        return {
-            "filename": os.path.basename(LOADER_PATH),
-            "size": size,
-            "hash": file_hash,
-            "signature": signature,
-            "version": LOADER_VERSION
-        }
+        if not sha256:
+            await _long_poll(wait, _info_unchanged(request, "loader", client_id, known))
+        artifact = _select("loader", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_LOADER_FILE)
+        return _json_or_304(request, artifact.info_json, artifact.etag)
     except Exception as e:
         logger.error(f'Ошибка /loader_info: {e}')
         return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
 
 
 @router.get("/loader_download")
-def loader_download():
+async def loader_download(request: Request, client_id: str = None, sha256: str = None):
     try:
-        if not os.path.exists(LOADER_PATH):
-            raise HTTPException(status_code=404, detail='loader not found')
-        return FileResponse(LOADER_PATH, filename=os.path.basename(LOADER_PATH))
+        artifact = _select("loader", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_LOADER_FILE)
+        return _file_or_304(request, artifact)
     except Exception as e:
         logger.error(f'Ошибка /loader_download: {e}')
         return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
+
+
+@router.get("/client_chunks")
+async def client_chunks(request: Request, client_id: str = None, sha256: str = None):
+    """Хэши чанков клиента; их Merkle-корень подписан и указан в манифесте."""
+    try:
+        artifact = _select("client", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_CLIENT_FILE)
+        return _json_or_304(request, artifact.chunks_json, f'"{artifact.hash}-chunks"',
+                            poll=False)
+    except Exception as e:
+        logger.error(f'Ошибка /client_chunks: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
+
+
+@router.get("/loader_chunks")
+async def loader_chunks(request: Request, client_id: str = None, sha256: str = None):
+    """Хэши чанков loader; их Merkle-корень подписан и указан в манифесте."""
+    try:
+        artifact = _select("loader", client_id, sha256)
+        if artifact is None:
+            return _not_found(BUILD_LOADER_FILE)
+        return _json_or_304(request, artifact.chunks_json, f'"{artifact.hash}-chunks"',
+                            poll=False)
+    except Exception as e:
+        logger.error(f'Ошибка /loader_chunks: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
+
+
+@router.get("/client_patch")
+async def client_patch(request: Request, from_hash: str = Query(alias="from"), to: str = None,
+                       client_id: str = None):
+    """bsdiff-патч от версии клиента from к текущей (или к to)."""
+    try:
+        return _patch_response(request, "client", from_hash, to, client_id)
+    except Exception as e:
+        logger.error(f'Ошибка /client_patch: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
+
+
+@router.get("/loader_patch")
+async def loader_patch(request: Request, from_hash: str = Query(alias="from"), to: str = None,
+                       client_id: str = None):
+    """bsdiff-патч от версии loader from к текущей (или к to)."""
+    try:
+        return _patch_response(request, "loader", from_hash, to, client_id)
+    except Exception as e:
+        logger.error(f'Ошибка /loader_patch: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
@@ -0,0 +1,98 @@
+import html
+import re
+import time
+from collections import OrderedDict
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from bot.service.loader import logger
+from utils.cluster import cluster
+from utils.rollout import rollout
+
+router = APIRouter()
+
+# Не чаще одного уведомления администратору на клиента за этот интервал (секунды)
+REPORT_MIN_INTERVAL = 600
+# Эндпоинт без авторизации: client_id выбирает отправитель, поэтому есть и общий предел
+# уведомлений за окно, а память на клиентов ограничена (LRU)
+REPORT_GLOBAL_MAX = 10
+REPORT_GLOBAL_WINDOW = 600
+REPORT_TRACKED_CLIENTS = 4096
+CLIENT_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_last_report = OrderedDict()
+_window = {"started": -REPORT_GLOBAL_WINDOW, "sent": 0}
+
+
+def _validate(report):
+    """Текст ошибки для некорректного отчёта или None."""
+    if not isinstance(report, dict) or report.get("event") != "crash_loop":
+        return 'unsupported report'
+    if not isinstance(report.get("client_id"), str) or not CLIENT_ID_RE.match(report["client_id"]):
+        return 'invalid client_id'
+    if type(report.get("restarts")) is not int:
+        return 'invalid restarts'
+    # Процесс мог не запуститься вовсе — тогда кода выхода нет
+    if report.get("exit_code") is not None and type(report["exit_code"]) is not int:
+        return 'invalid exit_code'
+    client_hash = report.get("client_sha256")
+    if client_hash is not None and (not isinstance(client_hash, str) or not SHA256_RE.match(client_hash)):
+        return 'invalid client_sha256'
+    if not isinstance(report.get("loader_version", ""), (str, int)):
+        return 'invalid loader_version'
+    return None
+
+
+def _allow(client_id, now):
+    """Лимит на клиента и общий лимит уведомлений администратору."""
+    last = _last_report.get(client_id)
+    if last is not None and now - last < REPORT_MIN_INTERVAL:
+        return False
+    if now - _window["started"] >= REPORT_GLOBAL_WINDOW:
+        _window.update(started=now, sent=0)
+    if _window["sent"] >= REPORT_GLOBAL_MAX:
+        return False
+    _window["sent"] += 1
+    _last_report[client_id] = now
+    _last_report.move_to_end(client_id)
+    while len(_last_report) > REPORT_TRACKED_CLIENTS:
+        _last_report.popitem(last=False)
+    return True
+
+
+def _format_crash_loop(report):
+    client_hash = report.get("client_sha256") or ""
+    loader_version = html.escape(str(report.get("loader_version", "?"))[:32])
+    text = (
+        f'⚠ Crash loop клиента на (<code>{html.escape(report["client_id"])}</code>): '
+        f'{report["restarts"]} падений подряд, код выхода {report.get("exit_code")}.\n'
+        f'Версия клиента: <code>{client_hash[:12] or "?"}</code>, '
+        f'loader {loader_version}.'
+    )
+    state = rollout.status().get("client", {})
+    if client_hash and client_hash == state.get("candidate"):
+        text += f'\nЭто кандидат раскатки ({state["percent"]}%): /rollout_abort client'
+    return text
+
+
+@router.post("/loader_report")
+async def loader_report(request: Request):
+    """Отчёт loader о проблемах клиента (сейчас — crash loop), пересылается администратору."""
+    try:
+        report = await request.json()
+        error = _validate(report)
+        if error is not None:
+            return JSONResponse({"error": error}, status_code=400)
+        client_id = report["client_id"]
+        logger.warning(f'({client_id}) Crash loop клиента: {report["restarts"]} падений подряд, '
+                       f'код выхода {report.get("exit_code")}.')
+        if _allow(client_id, time.monotonic()):
+            try:
+                await cluster.to_bot("admin_notice", text=_format_crash_loop(report))
+            except Exception as e:
+                logger.error(f'Ошибка отправки сообщения администратору: {e}')
+        return JSONResponse({"status": "ok"})
+    except Exception as e:
+        logger.error(f'Ошибка /loader_report: {e}')
+        return JSONResponse({"error": f'Unexpected error: {str(e)}'}, status_code=500)
@@ -1,33 +1,77 @@
+import asyncio
 import json
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
 from websockets.exceptions import ConnectionClosedError, ConnectionClosedOK
 
-from bot.service import config
-from bot.service.loader import bot, db, logger
-from bot.utils.async_funcs import on_client_result
+from bot.service.loader import db, logger
+from utils.cluster import cluster
+from utils.config_loader import HEARTBEAT_INTERVAL, IDLE_TICK, IDLE_TIMEOUT
+from utils.registry import CLOSE_IDLE, CLOSE_REPLACED, registry
 
 router = APIRouter()
-connected_clients = {}
+# Текстовый ping клиентов до перехода на control frames: учитывается без разбора json
+LEGACY_PING = json.dumps({"command": "ping"})
+# Фоновые задачи снятия клиентов с кластера
+_releasing = set()
+
+
+async def _release(session):
+    try:
+        await cluster.release(session)
+    except Exception as e:
+        logger.warning(f'({session.client_id}) Не удалось снять клиента с кластера: {e}')
+
+
+async def watch_idle():
+    """
+    Закрывает сессии, от которых дольше idle_timeout не было ни одного кадра (полуоткрытые).
+    Закрытие и снятие с кластера идут в фоне: цикл не ждёт ни сокеты, ни БД.
+    """
+    while True:
+        await asyncio.sleep(IDLE_TICK)
+        for session in registry.idle_sessions():
+            logger.info(f'({session.client_id}) Нет активности {IDLE_TIMEOUT:.0f} с, закрываю сессию.')
+            if registry.unregister(session):
+                task = asyncio.create_task(_release(session))
+                _releasing.add(task)
+                task.add_done_callback(_releasing.discard)
+            session.close(CLOSE_IDLE)
 
 
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id):
+async def websocket_endpoint(websocket: WebSocket, client_id, version: str = Query(None),
+                             tags: str = Query("")):
     """
     WebSocket подключение от любого клиента.
-    Любой client_id разрешён.
+    Любой client_id разрешён. version и tags (через запятую) попадают в индексы registry.
     """
     await websocket.accept()
-    connected_clients[client_id] = websocket
-    logger.info(f'({client_id}) Пользователь подключился.')
+    session, evicted = registry.register(client_id, websocket, version, tags)
+    if evicted is not None:
+        logger.info(f'({client_id}) Повторное подключение, старая сессия закрыта.')
+        # Мёртвый старый сокет не должен задерживать hello и claim нового подключения
+        evicted.close(CLOSE_REPLACED)
+    logger.info(f'({client_id}) Пользователь подключился (версия {session.version}).')
+    # Клиент шлёт ping control frames с этим интервалом и отмечается кадром чаще idle_timeout.
+    # Через очередь сессии: в сокет пишет только её задача-писатель
+    try:
+        session.enqueue({"command": "hello", "heartbeat_interval": HEARTBEAT_INTERVAL,
+                         "idle_timeout": IDLE_TIMEOUT}, urgent=True)
+    except Exception as e:
+        logger.warning(f'({client_id}) Не удалось отправить hello: {e}')
+    try:
+        await cluster.claim(session)
+    except Exception as e:
+        logger.error(f'({client_id}) Не удалось зарегистрировать клиента в кластере: {e}')
     try:
         user = await db.user_exists(client_id)
         if not user:
             await db.add_user(client_id)
             try:
-                await bot.send_message(
-                    config.ADMIN_ID,
-                    f'Новое устройство добавлено в db: <code>{client_id}</code>.'
+                await cluster.to_bot(
+                    "admin_notice",
+                    text=f'Новое устройство добавлено в db: <code>{client_id}</code>.'
                 )
             except Exception as e:
                 logger.warning(f'Не удалось отправить сообщение в Telegram: {e}')
@@ -37,12 +81,22 @@ async def websocket_endpoint(websocket: WebSocket, client_id):
     try:
         while True:
             try:
-                message = await websocket.receive_text()
+                frame = await websocket.receive()
             except (WebSocketDisconnect, ConnectionClosedOK, ConnectionClosedError):
                 raise WebSocketDisconnect()
             except Exception as e:
                 logger.warning(f'({client_id}) Ошибка получения сообщения: {e}')
                 break
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            message = frame.get("text")
+            if message is None:
+                # Бинарный кадр (в т.ч. пустой keepalive) — только отметка активности
+                session.received(len(frame.get("bytes") or b""))
+                continue
+            session.received(len(message))
+            if message == LEGACY_PING:
+                continue
             try:
                 data = json.loads(message)
             except json.JSONDecodeError:
@@ -52,7 +106,7 @@ async def websocket_endpoint(websocket: WebSocket, client_id):
             status = data.get("status")
             if status == "ok":
                 try:
-                    await on_client_result(client_id, data)
+                    await cluster.to_bot("client_result", client_id=client_id, result_json=data)
                 except Exception as e:
                     logger.error(f'({client_id}) Ошибка обработки результата: {e}')
                 continue
@@ -63,4 +117,5 @@ async def websocket_endpoint(websocket: WebSocket, client_id):
     except Exception as e:
         logger.error(f'({client_id}) Непредвиденная ошибка websocket: {e}')
     finally:
-        connected_clients.pop(client_id, None)
+        if registry.unregister(session):
+            await _release(session)
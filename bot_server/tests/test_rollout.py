@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from utils.rollout import RolloutController, cohort
+
+
+def make_rollout(tmp_path, steps=(10, 50, 100), step_interval=3600):
+    controller = RolloutController(str(tmp_path / "rollout.json"), list(steps), step_interval)
+    asyncio.run(controller.on_publish("client", "stable"))
+    asyncio.run(controller.on_publish("client", "candidate"))
+    return controller
+
+
+def test_cohort_selection(tmp_path):
+    controller = make_rollout(tmp_path)
+    clients = [f"pc-{i}" for i in range(1000)]
+    selected = {c: controller.select("client", c, "candidate") for c in clients}
+    for client_id, version in selected.items():
+        expected = "candidate" if cohort("client", client_id) < 10 else "stable"
+        assert version == expected
+    assert 50 < sum(v == "candidate" for v in selected.values()) < 150
+    # Без client_id кандидат не выдаётся
+    assert controller.select("client", None, "candidate") == "stable"
+
+
+def test_time_promotion(tmp_path):
+    controller = make_rollout(tmp_path)
+    assert controller.tick()
+    assert not controller.tick()
+    controller._state["client"]["step_started"] = time.time() - 2 * 3600 - 1
+    assert controller.tick()
+    assert controller.status()["client"] == {
+        "stable": "candidate", "candidate": None, "percent": 100, "paused": False,
+    }
+
+
+def test_advance_without_final_100(tmp_path):
+    controller = make_rollout(tmp_path, steps=(10, 50))
+    assert controller.advance("client")
+    assert controller.status()["client"]["stable"] == "candidate"
+    assert not controller.advance("client")
+
+
+def test_saved_step_beyond_steps(tmp_path):
+    controller = make_rollout(tmp_path)
+    controller._state["client"]["step"] = 9
+    assert controller.select("client", "pc-1", "candidate") == "candidate"
+    assert controller.status()["client"]["candidate"] is None
+
+
+def test_abort(tmp_path):
+    controller = make_rollout(tmp_path)
+    assert controller.abort("client")
+    asyncio.run(controller.flush())
+    assert all(controller.select("client", f"pc-{i}", "candidate") == "stable" for i in range(100))
+    # Отменённая сборка не запускает раскатку заново
+    assert asyncio.run(controller.on_publish("client", "candidate")) == "stable"
+    assert controller.status()["client"]["candidate"] is None
+
+
+def test_flush_and_reload(tmp_path):
+    controller = make_rollout(tmp_path)
+    controller.pause("client")
+    asyncio.run(controller.flush())
+    other = RolloutController(str(tmp_path / "rollout.json"), [10, 50, 100], 3600)
+    assert other.status()["client"]["paused"]
+    controller.resume("client")
+    asyncio.run(other.reload())
+    assert other.status()["client"]["paused"]
@@ -0,0 +1,44 @@
+from utils.timing_wheel import TimingWheel
+
+
+def test_deadline_inside_current_tick():
+    wheel = TimingWheel(tick=1, slots=301)
+    wheel._current = 1300
+    wheel.schedule("a", 1300.6)
+    assert wheel.advance(1300.3) == []
+    assert wheel.advance(1301.0) == ["a"]
+    assert len(wheel) == 0
+
+
+def test_deadline_fires_within_one_tick():
+    wheel = TimingWheel(tick=1, slots=301)
+    wheel._current = 1000
+    wheel.schedule("a", 1300.6)
+    now = 1000.0
+    fired = []
+    while not fired:
+        now += 0.25
+        fired = wheel.advance(now)
+    assert fired == ["a"]
+    assert 1300.6 <= now <= 1301.6
+
+
+def test_deadline_beyond_one_revolution():
+    wheel = TimingWheel(tick=1, slots=8)
+    wheel._current = 0
+    wheel.schedule("a", 20.5)
+    for now in range(1, 21):
+        assert wheel.advance(now) == []
+    assert wheel.advance(21) == ["a"]
+
+
+def test_reschedule_and_cancel():
+    wheel = TimingWheel(tick=1, slots=8)
+    wheel._current = 0
+    wheel.schedule("a", 2.5)
+    wheel.schedule("a", 5.5)
+    wheel.schedule("b", 3.5)
+    wheel.cancel("b")
+    assert wheel.advance(4) == []
+    assert wheel.advance(6) == ["a"]
+    assert len(wheel) == 0
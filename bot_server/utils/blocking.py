@@ -0,0 +1,33 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config_loader import BLOCKING_WORKERS
+
+# Отдельный ограниченный пул: хэширование и подпись не занимают общий executor
+# event loop и не могут запустить больше BLOCKING_WORKERS потоков разом
+executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args):
+    """Выполняет блокирующую функцию в пуле executor, не останавливая event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом: N холодных запросов
+    ждут одно вычисление. Отмена одного из ожидающих не отменяет вычисление.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def run(self, key, func, *args):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(run_blocking(func, *args))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -0,0 +1,47 @@
+import time
+
+from utils.config_loader import (POLL_INTERVAL, POLL_INTERVAL_MAX,
+                                 POLL_TARGET_RPS)
+
+
+class PollPolicy:
+    """
+    Рекомендуемый интервал опроса для loader'ов.
+    Считает частоту запросов к info-эндпоинтам окнами по `window` секунд
+    и растягивает интервал, пока фактический поток выше `target_rps`.
+    """
+
+    def __init__(self, base=POLL_INTERVAL, max_interval=POLL_INTERVAL_MAX,
+                 target_rps=POLL_TARGET_RPS, window=10.0):
+        self.base = base
+        self.max_interval = max_interval
+        self.target_rps = target_rps
+        self.window = window
+        self._interval = float(base)
+        self._count = 0
+        self._window_start = time.monotonic()
+
+    def hit(self):
+        """Учитывает один запрос и пересчитывает интервал по окончании окна."""
+        self._count += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        rate = self._count / elapsed
+        self._count = 0
+        self._window_start = now
+        if self.target_rps <= 0:
+            return
+        # Корень сглаживает реакцию: loader'ы узнают новый интервал лишь на следующем опросе
+        interval = self._interval * (rate / self.target_rps) ** 0.5
+        self._interval = min(max(interval, self.base), self.max_interval)
+
+    def interval(self):
+        return int(self._interval)
+
+    def headers(self):
+        return {"Cache-Control": f"max-age={self.interval()}"}
+
+
+poll_policy = PollPolicy()
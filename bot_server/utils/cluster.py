@@ -0,0 +1,414 @@
+import asyncio
+import json
+import logging
+import uuid
+
+import asyncpg
+
+from utils.registry import CLOSE_REPLACED, registry
+
+logger = logging.getLogger("bot_server")
+
+# Все воркеры слушают общий канал событий и свой канал команд, процесс бота — ещё и BOT_CHANNEL
+BROADCAST_CHANNEL = "rpc_broadcast"
+WORKER_CHANNEL_PREFIX = "rpc_worker_"
+BOT_CHANNEL = "rpc_bot"
+# Контракт шины (JSON в payload NOTIFY):
+#   бот -> шлюз-владелец клиента:  {"client_id": ..., "data": {команда клиенту}, "urgent": bool}
+#   шлюз -> прежний владелец:      {"evict": client_id}
+#   шлюз -> бот (BOT_CHANNEL):     {"type": "client_result", "client_id": ..., "result_json": {...}}
+#                                  {"type": "admin_notice", "text": ...}
+#   всем (BROADCAST_CHANNEL):      {"event": "rollout", "worker": ...}
+# Ключ advisory lock, под которым работает единственный Telegram-поллер
+POLLER_LOCK_ID = 0x52504331
+PUBLISHER_LOCK_ID = 0x52504332
+LOCK_RETRY_INTERVAL = 10
+HEARTBEAT_INTERVAL = 10
+# Проверка соединений LISTEN и блокировки: не ответило за это время — считается потерянным
+PING_TIMEOUT = 5
+RECONNECT_INTERVAL = 2
+# Воркер без heartbeat дольше этого считается мёртвым вместе с его клиентами
+WORKER_TTL = 30
+# Предел payload NOTIFY в PostgreSQL — 8000 байт
+MAX_PAYLOAD = 7900
+
+
+class Cluster:
+    """
+    Несколько воркеров uvicorn и отдельный процесс бота как один сервер.
+    Каждый шлюз публикует своих клиентов в cluster_clients, команда для чужого
+    клиента уходит владельцу через NOTIFY в его канал, результаты и уведомления
+    для администратора — в канал бота. События (например, перечитать раскатку)
+    рассылаются всем. В одном процессе всё работает локально, без БД.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.enabled = False
+        self.worker_id = uuid.uuid4().hex[:16]
+        self._pool = None
+        self._listener = None
+        self._listening_bot = False
+        self._reconnecting = False
+        self._events = {}
+        self._bot_handlers = {}
+        self._tasks = set()
+
+    @property
+    def channel(self):
+        return f"{WORKER_CHANNEL_PREFIX}{self.worker_id}"
+
+    async def start(self, pool, enabled):
+        self.enabled = enabled
+        if not enabled:
+            return
+        self._pool = pool
+        await self._listen()
+        await self._beat()
+        self._spawn(self._heartbeat())
+        logger.info(f'Воркер {self.worker_id} в кластере.')
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if not self.enabled:
+            return
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute("DELETE FROM cluster_clients WHERE worker=$1", self.worker_id)
+                await conn.execute("DELETE FROM cluster_workers WHERE worker=$1", self.worker_id)
+            listener, self._listener = self._listener, None
+            if listener is not None:
+                listener.remove_termination_listener(self._on_listener_lost)
+                await self._pool.release(listener)
+        except Exception as e:
+            logger.warning(f'Не удалось выйти из кластера: {e}')
+
+    async def _listen(self):
+        """Отдельное соединение пула под LISTEN: каналы воркера, рассылок и (у поллера) бота."""
+        conn = await self._pool.acquire()
+        try:
+            await conn.add_listener(self.channel, self._on_worker_message)
+            await conn.add_listener(BROADCAST_CHANNEL, self._on_broadcast)
+            if self._listening_bot:
+                await conn.add_listener(BOT_CHANNEL, self._on_bot_message)
+        except BaseException:
+            await self._pool.release(conn)
+            raise
+        conn.add_termination_listener(self._on_listener_lost)
+        self._listener = conn
+
+    def _on_listener_lost(self, conn):
+        if conn is self._listener:
+            self._spawn(self._relisten())
+
+    async def _relisten(self):
+        """
+        LISTEN-соединение потеряно (перезапуск PostgreSQL, сбой сети): без него воркер
+        молча не получает команды, вытеснения и рассылки. Переподключаемся, затем
+        сверяем владельцев: вытеснения, пришедшие в разрыв, потеряны.
+        """
+        if self._reconnecting:
+            return
+        self._reconnecting = True
+        logger.error(f'Воркер {self.worker_id} потерял LISTEN-соединение, переподключаюсь.')
+        try:
+            old, self._listener = self._listener, None
+            if old is not None:
+                old.remove_termination_listener(self._on_listener_lost)
+                try:
+                    await self._pool.release(old)
+                except Exception:
+                    old.terminate()
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception as e:
+                    logger.warning(f'Не удалось восстановить LISTEN: {e}')
+                    await asyncio.sleep(RECONNECT_INTERVAL)
+            logger.info(f'Воркер {self.worker_id} снова слушает шину.')
+            await self._drop_foreign_sessions()
+        finally:
+            self._reconnecting = False
+
+    async def _drop_foreign_sessions(self):
+        """Закрывает локальные сессии, которые за время разрыва перешли к другим воркерам."""
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT client_id FROM cluster_clients WHERE client_id = ANY($1::text[]) AND worker<>$2",
+                self.registry.ids(), self.worker_id
+            )
+        for row in rows:
+            self._evict(row["client_id"])
+
+    async def _alive(self, conn):
+        try:
+            await asyncio.wait_for(conn.fetchval("SELECT 1"), PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _beat(self):
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                "INSERT INTO cluster_workers (worker, heartbeat) VALUES ($1, now()) "
+                "ON CONFLICT (worker) DO UPDATE SET heartbeat=now()", self.worker_id
+            )
+            # Клиенты упавших воркеров не должны числиться подключёнными
+            await conn.execute(
+                "DELETE FROM cluster_workers WHERE heartbeat < now() - make_interval(secs => $1)",
+                WORKER_TTL
+            )
+            await conn.execute(
+                "DELETE FROM cluster_clients c WHERE NOT EXISTS "
+                "(SELECT 1 FROM cluster_workers w WHERE w.worker=c.worker)"
+            )
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self._beat()
+            except Exception as e:
+                logger.warning(f'Heartbeat кластера не удался: {e}')
+            # Тихий обрыв сети termination listener не замечает, пока соединение молчит
+            listener = self._listener
+            if listener is not None and not self._reconnecting and not await self._alive(listener):
+                self._spawn(self._relisten())
+
+    async def run_exclusive(self, func, lock_id=POLLER_LOCK_ID, title="Telegram-поллер"):
+        """
+        func() только в одном воркере: у держателя advisory lock lock_id. Остальные ждут
+        и подхватывают работу, когда держатель завершится и соединение закроется.
+        Блокировка живёт, пока живо соединение: если оно потеряно, func() останавливается
+        (её уже может выполнять другой воркер), а воркер снова встаёт в очередь за блокировкой.
+        """
+        if not self.enabled:
+            return await func()
+        while True:
+            try:
+                async with self._pool.acquire() as conn:
+                    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_id):
+                        await asyncio.sleep(LOCK_RETRY_INTERVAL)
+                    logger.info(f'Воркер {self.worker_id} получил блокировку: {title}.')
+                    lost = asyncio.Event()
+
+                    def on_lost(_):
+                        lost.set()
+
+                    conn.add_termination_listener(on_lost)
+                    task = asyncio.ensure_future(func())
+                    watchdog = asyncio.create_task(self._watch_lock(conn, lost))
+                    lost_wait = asyncio.create_task(lost.wait())
+                    try:
+                        await asyncio.wait({task, lost_wait}, return_when=asyncio.FIRST_COMPLETED)
+                        if task.done():
+                            return task.result()
+                        logger.error(f'Воркер {self.worker_id} потерял соединение с блокировкой, '
+                                     f'останавливаю: {title}.')
+                    finally:
+                        conn.remove_termination_listener(on_lost)
+                        watchdog.cancel()
+                        lost_wait.cancel()
+                        if not task.done():
+                            task.cancel()
+                            try:
+                                await task
+                            except BaseException:
+                                pass
+                        if not lost.is_set():
+                            await conn.execute("SELECT pg_advisory_unlock($1)", lock_id)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning(f'Ошибка соединения блокировки ({title}): {e}')
+            await asyncio.sleep(RECONNECT_INTERVAL)
+
+    async def _watch_lock(self, conn, lost):
+        while not lost.is_set():
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if not await self._alive(conn):
+                lost.set()
+
+    async def claim(self, session):
+        """Отмечает клиента за этим воркером; прежний владелец закрывает свою копию сессии."""
+        if not self.enabled:
+            return
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                previous = await conn.fetchval(
+                    "SELECT worker FROM cluster_clients WHERE client_id=$1 FOR UPDATE", session.client_id
+                )
+                await conn.execute(
+                    "INSERT INTO cluster_clients (client_id, worker, version, tags) VALUES ($1, $2, $3, $4) "
+                    "ON CONFLICT (client_id) DO UPDATE SET worker=$2, version=$3, tags=$4, connected_at=now()",
+                    session.client_id, self.worker_id, session.version, list(session.tags)
+                )
+            if previous and previous != self.worker_id:
+                await self._notify(conn, f"{WORKER_CHANNEL_PREFIX}{previous}",
+                                   {"evict": session.client_id})
+
+    async def release(self, session):
+        if not self.enabled:
+            return
+        async with self._pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM cluster_clients WHERE client_id=$1 AND worker=$2",
+                session.client_id, self.worker_id
+            )
+
+    async def send(self, client_id, data, urgent=False):
+        """
+        Ставит команду в очередь клиента на любом воркере, не дожидаясь сокета.
+        False — клиент не подключен; OutboxFull — очередь клиента переполнена.
+        """
+        session = self.registry.get(client_id)
+        if session is not None:
+            session.enqueue(data, urgent)
+            return True
+        if not self.enabled:
+            return False
+        async with self._pool.acquire() as conn:
+            worker = await conn.fetchval(
+                "SELECT c.worker FROM cluster_clients c JOIN cluster_workers w USING (worker) "
+                "WHERE c.client_id=$1 AND w.heartbeat > now() - make_interval(secs => $2)",
+                client_id, WORKER_TTL
+            )
+            if worker is None:
+                return False
+            await self._notify(conn, f"{WORKER_CHANNEL_PREFIX}{worker}",
+                               {"client_id": client_id, "data": data, "urgent": urgent})
+        return True
+
+    async def client_ids(self, tag=None, version=None):
+        """client_id подключённых клиентов всего кластера, с отбором по тегу или версии."""
+        if not self.enabled:
+            if tag is not None:
+                sessions = self.registry.by_tag(tag)
+            elif version is not None:
+                sessions = self.registry.by_version(version)
+            else:
+                return self.registry.ids()
+            return sorted(session.client_id for session in sessions)
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT c.client_id FROM cluster_clients c JOIN cluster_workers w USING (worker) "
+                "WHERE w.heartbeat > now() - make_interval(secs => $1) "
+                "AND ($2::text IS NULL OR $2 = ANY(c.tags)) AND ($3::text IS NULL OR c.version=$3) "
+                "ORDER BY c.client_id",
+                WORKER_TTL, tag, version
+            )
+        return [row["client_id"] for row in rows]
+
+    async def versions(self):
+        """{версия: число клиентов} по всему кластеру."""
+        if not self.enabled:
+            return self.registry.versions()
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT c.version, count(*) AS clients FROM cluster_clients c "
+                "JOIN cluster_workers w USING (worker) "
+                "WHERE w.heartbeat > now() - make_interval(secs => $1) GROUP BY c.version",
+                WORKER_TTL
+            )
+        return {row["version"]: row["clients"] for row in rows}
+
+    def subscribe(self, event, handler):
+        """handler() (корутина) вызывается в каждом воркере, кроме отправителя, при broadcast(event)."""
+        self._events[event] = handler
+
+    def handle(self, kind, handler):
+        """handler(**payload) — обработчик сообщений шлюза боту, если бот работает в этом процессе."""
+        self._bot_handlers[kind] = handler
+
+    async def listen_bot(self):
+        """Принимать сообщения шлюзов боту. Вызывается только держателем блокировки поллера."""
+        self._listening_bot = True
+        if self.enabled and self._listener is not None:
+            await self._listener.add_listener(BOT_CHANNEL, self._on_bot_message)
+
+    async def unlisten_bot(self):
+        """Блокировка поллера отдана: сообщения боту обрабатывает новый держатель."""
+        self._listening_bot = False
+        if self.enabled and self._listener is not None:
+            try:
+                await self._listener.remove_listener(BOT_CHANNEL, self._on_bot_message)
+            except Exception as e:
+                logger.warning(f'Не удалось отписаться от канала бота: {e}')
+
+    async def to_bot(self, kind, **payload):
+        """Сообщение боту: напрямую, если бот в этом процессе, иначе через BOT_CHANNEL."""
+        handler = self._bot_handlers.get(kind)
+        if handler is not None:
+            return await handler(**payload)
+        if not self.enabled:
+            logger.warning(f'Нет получателя для сообщения боту {kind}.')
+            return
+        async with self._pool.acquire() as conn:
+            await self._notify(conn, BOT_CHANNEL, {"type": kind, **payload})
+
+    async def broadcast(self, event):
+        if not self.enabled:
+            return
+        async with self._pool.acquire() as conn:
+            await self._notify(conn, BROADCAST_CHANNEL, {"event": event, "worker": self.worker_id})
+
+    @staticmethod
+    async def _notify(conn, channel, message):
+        payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        if len(payload.encode()) > MAX_PAYLOAD:
+            raise ValueError('Команда слишком большая для передачи между воркерами')
+        await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+    def _on_broadcast(self, conn, pid, channel, payload):
+        message = json.loads(payload)
+        handler = self._events.get(message.get("event"))
+        if handler is not None and message.get("worker") != self.worker_id:
+            self._spawn(self._run_handler(message["event"], handler))
+
+    def _on_bot_message(self, conn, pid, channel, payload):
+        message = json.loads(payload)
+        kind = message.pop("type", None)
+        handler = self._bot_handlers.get(kind)
+        if handler is None:
+            logger.warning(f'Неизвестное сообщение боту: {kind}')
+            return
+        self._spawn(self._run_handler(kind, handler, **message))
+
+    async def _run_handler(self, event, handler, **payload):
+        try:
+            await handler(**payload)
+        except Exception as e:
+            logger.error(f'Ошибка обработки события кластера {event}: {e}')
+
+    def _on_worker_message(self, conn, pid, channel, payload):
+        message = json.loads(payload)
+        if "evict" in message:
+            self._evict(message["evict"])
+        else:
+            self._deliver(message["client_id"], message["data"], message.get("urgent", False))
+
+    def _deliver(self, client_id, data, urgent):
+        session = self.registry.get(client_id)
+        if session is None:
+            logger.warning(f'({client_id}) Команда от другого воркера, но клиент уже отключился.')
+            return
+        try:
+            session.enqueue(data, urgent)
+        except Exception as e:
+            logger.error(f'({client_id}) Не удалось доставить команду: {e}')
+
+    def _evict(self, client_id):
+        """Клиент переподключился к другому воркеру: закрываем здешнюю сессию."""
+        session = self.registry.get(client_id)
+        if session is None:
+            return
+        self.registry.unregister(session)
+        session.close(CLOSE_REPLACED)
+
+
+cluster = Cluster(registry)
@@ -2,7 +2,9 @@ import json
 import os
 from pathlib import Path
 
-CONFIG_PATH = Path(__file__).resolve().parent.parent / "settings.json"
+# BOT_SERVER_SETTINGS — другой файл настроек (стенды, benchmarks)
+CONFIG_PATH = Path(os.environ.get("BOT_SERVER_SETTINGS")
+                   or Path(__file__).resolve().parent.parent / "settings.json")
 
 def load_settings():
     if not os.path.exists(CONFIG_PATH):
@@ -12,15 +14,68 @@ def load_settings():
 
 settings = load_settings()
 
+BASE_DIR = Path(__file__).resolve().parents[1]
+
 build_settings = settings.get("build")
 BUILD_DIR = build_settings.get("build_dir")
 BUILD_CLIENT_FILE = build_settings.get("build_client_file")
 BUILD_LOADER_FILE = build_settings.get("build_loader_file")
 
-CLIENT_PATH = str(Path(__file__).resolve().parent.parent / BUILD_DIR / BUILD_CLIENT_FILE)
-LOADER_PATH = str(Path(__file__).resolve().parent.parent / BUILD_DIR / BUILD_LOADER_FILE)
+BUILD_PATH = str(BASE_DIR / BUILD_DIR)
 
-BASE_DIR = Path(__file__).resolve().parents[1]
-SIGN_PRIV_PATH = BASE_DIR / "sign_priv.pem"
+# Каталог с неизменяемыми опубликованными версиями артефактов
+STORE_PATH = str(BASE_DIR / build_settings.get("store_dir", "published"))
+WATCH_POLL_INTERVAL = float(build_settings.get("watch_poll_interval", 2))
+WATCH_SETTLE_DELAY = float(build_settings.get("watch_settle_delay", 1))
+# Сколько версий хранить для бинарных патчей и максимальный размер патча от размера файла
+KEEP_VERSIONS = int(build_settings.get("keep_versions", 5))
+PATCH_MAX_RATIO = float(build_settings.get("patch_max_ratio", 0.5))
+# Размер чанка для Merkle-манифеста и параллельной докачки
+CHUNK_SIZE = int(build_settings.get("chunk_size", 1024 * 1024))
+# Потоки для хэширования, подписи и сжатия сборок
+BLOCKING_WORKERS = int(build_settings.get("blocking_workers", 4))
+
+update_settings = settings.get("update", {})
+# Рекомендуемый интервал опроса loader'ов и его потолок под нагрузкой
+POLL_INTERVAL = int(update_settings.get("poll_interval", 30))
+POLL_INTERVAL_MAX = int(update_settings.get("poll_interval_max", 600))
+POLL_TARGET_RPS = float(update_settings.get("poll_target_rps", 200))
+# Максимальное время, на которое long-poll запрос ждёт новую версию
+LONG_POLL_MAX = float(update_settings.get("long_poll_max", 120))
+
+download_settings = settings.get("downloads", {})
+# Одновременные передачи артефактов, общий лимит исходящего потока (байт/с, 0 — без лимита)
+DOWNLOAD_MAX_CONCURRENT = int(download_settings.get("max_concurrent", 32))
+DOWNLOAD_MAX_RATE = int(download_settings.get("max_rate", 0))
+DOWNLOAD_RETRY_AFTER = int(download_settings.get("retry_after", 10))
+# Сколько версий держать отображёнными в память (mmap) для раздачи
+DELIVERY_CACHE_ENTRIES = int(download_settings.get("cache_entries", 8))
+
+rollout_settings = settings.get("rollout", {})
+# Проценты когорт по шагам раскатки и длительность одного шага в секундах.
+# Шаги по возрастанию в пределах 1..100, последний всегда 100 — на нём кандидат становится stable
+ROLLOUT_STEPS = sorted({min(max(int(p), 1), 100) for p in rollout_settings.get("steps", [1, 5, 25, 50, 100])})
+if not ROLLOUT_STEPS or ROLLOUT_STEPS[-1] != 100:
+    ROLLOUT_STEPS.append(100)
+ROLLOUT_STEP_INTERVAL = float(rollout_settings.get("step_interval", 3600))
+ROLLOUT_STATE_PATH = str(Path(STORE_PATH) / "rollout.json")
+
+websocket_settings = settings.get("websocket", {})
+# Интервал ping/pong (control frames), который сервер сообщает клиентам и использует сам
+HEARTBEAT_INTERVAL = float(websocket_settings.get("heartbeat_interval", 30))
+HEARTBEAT_TIMEOUT = float(websocket_settings.get("heartbeat_timeout", 20))
+# Сессия без входящих кадров дольше этого закрывается; проверка раз в idle_tick секунд
+IDLE_TIMEOUT = float(websocket_settings.get("idle_timeout", 300))
+IDLE_TICK = float(websocket_settings.get("idle_tick", 1))
+# Очередь исходящих сообщений на сессию и что делать при переполнении:
+# drop_oldest — вытеснить самое старое обычное, reject — отказать отправителю, disconnect — закрыть сессию
+OUTBOX_SIZE = int(websocket_settings.get("outbox_size", 64))
+OUTBOX_OVERFLOW = websocket_settings.get("outbox_overflow", "drop_oldest")
+if OUTBOX_OVERFLOW not in ("drop_oldest", "reject", "disconnect"):
+    OUTBOX_OVERFLOW = "drop_oldest"
+
+SIGN_PRIV_PATH = BASE_DIR / build_settings.get("sign_priv_path", "sign_priv.pem")
+# Ключ Ed25519: пока он есть, метаданные подписываются обеими схемами (переход с RSA)
+SIGN_ED25519_PRIV_PATH = BASE_DIR / build_settings.get("sign_ed25519_priv_path", "sign_ed25519.pem")
 
 LOADER_VERSION = "1"
@@ -0,0 +1,132 @@
+import asyncio
+import mmap
+import os
+import re
+from collections import OrderedDict
+from urllib.parse import quote
+
+from fastapi.responses import PlainTextResponse, Response
+
+from utils.config_loader import DELIVERY_CACHE_ENTRIES
+
+# Размер одного сообщения тела: крупнее — меньше переключений event loop на гигабайт
+SEND_SIZE = 256 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ArtifactCache:
+    """
+    Общие mmap неизменяемых версий из хранилища: байты читаются из page cache
+    без копирования в Python-буферы и без системного вызова read на запрос.
+    Файлы версий никогда не перезаписываются, поэтому отображение всегда актуально.
+    """
+
+    def __init__(self, max_entries=DELIVERY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._maps = OrderedDict()
+
+    def get(self, path):
+        """memoryview содержимого файла (пустой для файла нулевой длины)."""
+        view = self._maps.get(path)
+        if view is not None:
+            self._maps.move_to_end(path)
+            return view
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self._maps[path] = view
+        # Вытесненные отображения закроются сборщиком, когда их отпустят текущие ответы
+        while len(self._maps) > self.max_entries:
+            self._maps.popitem(last=False)
+        return view
+
+
+artifact_cache = ArtifactCache()
+
+
+def _parse_range(header, size):
+    """(start, end) одного диапазона; None — отдать файл целиком; ValueError — 416."""
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class ArtifactResponse(Response):
+    """
+    Отдача версии артефакта с поддержкой Range/If-Range. Тело отправляется
+    срезами общего mmap из artifact_cache: без read() и копий на запрос.
+    """
+
+    def __init__(self, path, filename=None, headers=None, media_type="application/octet-stream",
+                 cache=artifact_cache):
+        self.path = path
+        self.cache = cache
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        if filename is not None:
+            if quote(filename) != filename:
+                self.headers["content-disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+            else:
+                self.headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+    async def __call__(self, scope, receive, send):
+        size = os.path.getsize(self.path)
+        request_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        start, end = 0, size - 1
+        status = 200
+        http_range = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if http_range and (if_range is None or if_range == self.headers.get("etag")):
+            try:
+                selected = _parse_range(http_range, size)
+            except ValueError:
+                response = PlainTextResponse(status_code=416,
+                                             headers={"Content-Range": f"bytes */{size}"})
+                return await response(scope, receive, send)
+            if selected is not None:
+                start, end = selected
+                status = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1 if size else 0)
+        await send({"type": "http.response.start", "status": status, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or not size:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await self._send_body(scope, receive, send, start, end + 1)
+        if self.background is not None:
+            await self.background()
+
+    async def _send_body(self, scope, receive, send, start, stop):
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            view = self.cache.get(self.path)
+            for offset in range(start, stop, SEND_SIZE):
+                if disconnected.is_set():
+                    return
+                chunk = view[offset:min(offset + SEND_SIZE, stop)]
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": offset + SEND_SIZE < stop})
+        finally:
+            watcher.cancel()
@@ -0,0 +1,90 @@
+import asyncio
+import random
+import time
+
+from fastapi.responses import JSONResponse, Response
+
+from utils.config_loader import (DOWNLOAD_MAX_CONCURRENT, DOWNLOAD_MAX_RATE,
+                                 DOWNLOAD_RETRY_AFTER)
+
+
+class DownloadGovernor:
+    """
+    Допуск загрузок артефактов: не больше max_concurrent одновременных
+    передач и общий исходящий поток не выше max_rate байт/с (token bucket).
+    Лишние запросы получают 503 с Retry-After, поэтому волна обновлений
+    не отнимает event loop у websocket-сессий и бота.
+    """
+
+    def __init__(self, max_concurrent=DOWNLOAD_MAX_CONCURRENT, max_rate=DOWNLOAD_MAX_RATE,
+                 retry_after=DOWNLOAD_RETRY_AFTER):
+        self.max_concurrent = max_concurrent
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.active = 0
+        self._tokens = float(max_rate)
+        self._updated = time.monotonic()
+
+    def try_acquire(self):
+        if self.max_concurrent > 0 and self.active >= self.max_concurrent:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def busy(self):
+        """503 с разбросом Retry-After, чтобы отказанные loader'ы не вернулись разом."""
+        retry_after = random.randint(self.retry_after, self.retry_after * 2)
+        return JSONResponse(
+            {"error": 'Too many downloads, retry later'},
+            status_code=503,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def throttle(self, size):
+        """Списывает size байт из общего бакета, при нехватке ждёт пополнения."""
+        if self.max_rate <= 0 or not size:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.max_rate, self._tokens + (now - self._updated) * self.max_rate)
+        self._updated = now
+        self._tokens -= size
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.max_rate)
+
+    def admit(self, response):
+        """Ответ-файл под контролем губернатора или 503, если мест нет."""
+        if not self.try_acquire():
+            return self.busy()
+        return GovernedResponse(response, self)
+
+
+class GovernedResponse(Response):
+    """Обёртка ответа: ограничивает скорость отправки тела и освобождает слот по завершении."""
+
+    def __init__(self, response, governor):
+        self.response = response
+        self.governor = governor
+        self.status_code = response.status_code
+        self.raw_headers = response.raw_headers
+        self.background = response.background
+
+    async def __call__(self, scope, receive, send):
+        async def throttled_send(message):
+            if message["type"] == "http.response.body":
+                await self.governor.throttle(len(message.get("body", b"")))
+            await send(message)
+
+        # Без pathsend тело идёт через send, иначе сервер отправит файл мимо лимита
+        extensions = {k: v for k, v in scope.get("extensions", {}).items()
+                      if k != "http.response.pathsend"}
+        try:
+            self.response.background = self.background
+            await self.response({**scope, "extensions": extensions}, receive, throttled_send)
+        finally:
+            self.governor.release()
+
+
+governor = DownloadGovernor()
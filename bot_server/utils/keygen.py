@@ -0,0 +1,41 @@
+"""
+Генерация ключа Ed25519 для подписи метаданных артефактов.
+
+Запуск из bot_server:
+    python -m utils.keygen
+Приватный ключ сохраняется в sign_ed25519.pem, публичный выводится в консоль —
+его нужно вписать в ED25519_PUB_KEY_PEM в loader/main.py.
+"""
+
+import os
+import sys
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from utils.config_loader import SIGN_ED25519_PRIV_PATH
+
+
+def main():
+    if os.path.exists(SIGN_ED25519_PRIV_PATH):
+        print(f"{SIGN_ED25519_PRIV_PATH} уже существует, удалите его вручную для перевыпуска.")
+        sys.exit(1)
+    key = ed25519.Ed25519PrivateKey.generate()
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    fd = os.open(SIGN_ED25519_PRIV_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    print(f"Приватный ключ: {SIGN_ED25519_PRIV_PATH}")
+    print(public_pem.decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,698 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from utils.blocking import SingleFlight, run_blocking
+from utils.config_loader import (BUILD_CLIENT_FILE, BUILD_LOADER_FILE,
+                                 BUILD_PATH, CHUNK_SIZE, KEEP_VERSIONS,
+                                 LOADER_VERSION, PATCH_MAX_RATIO,
+                                 SIGN_ED25519_PRIV_PATH, SIGN_PRIV_PATH,
+                                 STORE_PATH,
+                                 WATCH_POLL_INTERVAL, WATCH_SETTLE_DELAY)
+from utils.rollout import rollout
+from utils.tools import (canonical_json, merkle_root, sign_hash_with_rsa,
+                         sign_with_ed25519)
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+try:
+    import bsdiff4
+except ImportError:
+    bsdiff4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("bot_server")
+
+READ_SIZE = 1024 * 1024
+PUBLISH_RETRIES = 5
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+# Сжатые варианты: Content-Encoding -> расширение файла в хранилище
+ENCODINGS = {"zstd": ".zst", "gzip": ".gz"}
+# Вариант хранится, только если он заметно меньше исходника
+MAX_COMPRESSED_RATIO = 0.95
+# Как часто проверять сдвиг когорт раскатки по времени, секунды
+ROLLOUT_TICK_INTERVAL = 1
+
+
+class ArtifactNotReady(Exception):
+    """Файл сборки ещё дописывается — публикацию нужно повторить позже."""
+
+
+class Artifact(NamedTuple):
+    """Неизменяемый снимок опубликованной версии артефакта."""
+    name: str
+    filename: str
+    path: str
+    hash: str
+    size: int
+    signature: str
+    version: str
+    generation: int
+    published_at: float
+    source_stat: tuple
+    etag: str
+    info: dict
+    info_json: bytes
+    chunk_size: int
+    merkle_root: str
+    chunks_json: bytes
+
+
+def stat_key(st):
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+class Manifest(NamedTuple):
+    """Подписанный список всех опубликованных артефактов."""
+    body: dict
+    signature: str
+    etag: str
+    json: bytes
+
+
+class ArtifactPublisher:
+    """
+    Следит за BUILD_DIR и публикует артефакты один раз на сборку:
+    хэш, размер и подпись считаются при появлении нового файла,
+    а эндпоинты отдают готовый снимок из памяти.
+    Пока идёт раскатка (rollout), рядом с новой версией раздаётся stable.
+    В кластере публикует один воркер (run() у держателя блокировки): он пишет
+    раздаваемые версии в published.json, остальные подхватывают их через sync().
+    """
+
+    def __init__(self, build_dir, store_dir, artifacts, urls, priv_key_path,
+                 ed25519_key_path=None, poll_interval=WATCH_POLL_INTERVAL, settle_delay=WATCH_SETTLE_DELAY,
+                 keep_versions=KEEP_VERSIONS, patch_max_ratio=PATCH_MAX_RATIO,
+                 chunk_size=CHUNK_SIZE, rollout=None):
+        self.build_dir = build_dir
+        self.store_dir = store_dir
+        self.patches_dir = os.path.join(store_dir, "patches")
+        self.published_path = os.path.join(store_dir, "published.json")
+        self.artifacts = artifacts
+        self.urls = urls
+        self.priv_key_path = priv_key_path
+        self.ed25519_key_path = ed25519_key_path
+        self.poll_interval = poll_interval
+        self.settle_delay = settle_delay
+        self.keep_versions = keep_versions
+        self.patch_max_ratio = patch_max_ratio
+        self.chunk_size = chunk_size
+        self.rollout = rollout
+        self._current = {}
+        # {name: {hash: Artifact}} — версии, которые сейчас раздаются (новая и stable)
+        self._versions = {}
+        # Подписанные манифесты по набору выбранных версий
+        self._manifests = {}
+        self._generation = 0
+        self._post_publish_lock = asyncio.Lock()
+        self._flights = SingleFlight()
+        # Счётчик изменений раздаваемых версий для long-poll запросов
+        self._revision = 0
+        self._changed = asyncio.Condition()
+        self._variants = {}
+        # _variants пишут потоки run_blocking (сжатие, чистка, загрузка stable) — одновременно
+        self._variants_lock = threading.Lock()
+        self._background = set()
+        # Этот воркер публикует сам; announce() оповещает остальные о новых версиях
+        self._leader = False
+        self._announce = None
+
+    def latest(self, name):
+        """Последняя опубликованная сборка или None, если она ещё не опубликована."""
+        return self._current.get(name)
+
+    def get(self, name, client_id=None):
+        """Версия артефакта для клиента с учётом раскатки или None, если он ещё не опубликован."""
+        current = self._current.get(name)
+        if current is None or self.rollout is None:
+            return current
+        selected = self.rollout.select(name, client_id, current.hash)
+        return self._versions.get(name, {}).get(selected, current)
+
+    @property
+    def revision(self):
+        return self._revision
+
+    async def notify(self):
+        """Будит long-poll запросы: набор раздаваемых версий мог измениться."""
+        async with self._changed:
+            self._revision += 1
+            self._changed.notify_all()
+
+    async def wait_changed(self, revision, timeout):
+        """Ждёт изменения новее revision не дольше timeout секунд."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self._revision != revision), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def version(self, name, file_hash):
+        """Раздаваемая версия с заданным хэшем или None."""
+        return self._versions.get(name, {}).get(file_hash)
+
+    async def manifest(self, client_id=None):
+        """Подписанный манифест версий, выбранных для клиента, или None, если публиковать нечего."""
+        selected = {name: self.get(name, client_id) for name in self._current}
+        key = tuple(sorted((name, a.hash) for name, a in selected.items()))
+        manifest = self._manifests.get(key)
+        if manifest is None and selected:
+            manifest = await self._flights.run(("manifest", key), self._build_manifest, selected)
+            self._manifests = {**self._manifests, key: manifest}
+        return manifest
+
+    def _manifest_entry(self, a):
+        urls = self.urls[a.name]
+        return {
+            "name": a.name,
+            "filename": a.filename,
+            "version": a.version,
+            "size": a.size,
+            "sha256": a.hash,
+            "chunk_size": a.chunk_size,
+            "merkle_root": a.merkle_root,
+            # Ссылки закреплены за версией: раскатка может сдвинуться между запросами
+            "url": f'{urls["url"]}?sha256={a.hash}',
+            "patch_url": urls["patch_url"],
+            "chunks_url": f'{urls["chunks_url"]}?sha256={a.hash}',
+        }
+
+    def _sign(self, data):
+        """
+        Подписи данных: RSA для всех loader'ов и Ed25519 для новых, если ключ задан.
+        Старые loader'ы проверяют только signature, лишнее поле им не мешает.
+        """
+        signatures = {"signature": sign_hash_with_rsa(self.priv_key_path, data)}
+        if self.ed25519_key_path and os.path.exists(self.ed25519_key_path):
+            signatures["signature_ed25519"] = sign_with_ed25519(self.ed25519_key_path, data)
+        return signatures
+
+    def _build_manifest(self, selected):
+        # Тело зависит только от содержимого: все воркеры отдают один и тот же манифест
+        # и ETag, счётчик публикаций процесса (Artifact.generation) сюда не попадает
+        body = {
+            "artifacts": [
+                self._manifest_entry(a)
+                for a in sorted(selected.values(), key=lambda a: a.name)
+            ],
+        }
+        signatures = self._sign(canonical_json(body))
+        payload = json.dumps({"manifest": body, **signatures}).encode()
+        return Manifest(
+            body=body,
+            signature=signatures["signature"],
+            etag=f'"{hashlib.sha256(payload).hexdigest()}"',
+            json=payload,
+        )
+
+    async def _swap(self, name, artifact, stable=None):
+        # Подменяем словари целиком: читатели всегда видят согласованный снимок
+        current = dict(self._current)
+        versions = dict(self._versions)
+        if artifact is None:
+            current.pop(name, None)
+            versions.pop(name, None)
+        else:
+            current[name] = artifact
+            versions[name] = {a.hash: a for a in (stable, artifact) if a is not None}
+        old = self._current.get(name)
+        self._current = current
+        self._versions = versions
+        if old is None or artifact is None or old.hash != artifact.hash:
+            self._manifests = {}
+            # Прогреваем манифест stable-когорты, чтобы первый опрос не ждал подписи
+            await self.manifest()
+            await self.notify()
+
+    def patch_path(self, name, from_hash, to_hash):
+        """Путь к готовому патчу from_hash -> to_hash или None, если его нет."""
+        if not SHA256_RE.match(from_hash) or not SHA256_RE.match(to_hash):
+            return None
+        path = os.path.join(self.patches_dir, f"{from_hash}-{to_hash}-{self.artifacts[name]}.bsdiff")
+        return path if os.path.exists(path) else None
+
+    def variants(self, artifact):
+        """Готовые сжатые варианты версии: {encoding: path}."""
+        return self._variants.get(artifact.hash, {})
+
+    def _compress_sync(self, artifact):
+        """Готовит zstd- и gzip-варианты версии (один раз, результат кэшируется на диске)."""
+        variants = {}
+        for encoding, ext in ENCODINGS.items():
+            if encoding == "zstd" and zstandard is None:
+                continue
+            path = artifact.path + ext
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(artifact.path, "rb") as fin, open(tmp_path, "wb") as fout:
+                    if encoding == "zstd":
+                        zstandard.ZstdCompressor(level=19, threads=-1).copy_stream(fin, fout)
+                    else:
+                        with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=9, mtime=0) as gz:
+                            while chunk := fin.read(READ_SIZE):
+                                gz.write(chunk)
+                if os.path.getsize(tmp_path) > artifact.size * MAX_COMPRESSED_RATIO:
+                    os.remove(tmp_path)
+                    continue
+                os.replace(tmp_path, path)
+                logger.info(f'{artifact.filename} {encoding}: {os.path.getsize(path)} байт.')
+            variants[encoding] = path
+        with self._variants_lock:
+            self._variants = {**self._variants, artifact.hash: variants}
+
+    def _stored_versions(self, name):
+        """Версии артефакта в хранилище: [(hash, path)], новые первыми."""
+        suffix = "-" + self.artifacts[name]
+        versions = []
+        for entry in os.scandir(self.store_dir):
+            file_hash = entry.name[:-len(suffix)]
+            if entry.name.endswith(suffix) and SHA256_RE.match(file_hash):
+                versions.append((entry.stat().st_mtime, file_hash, entry.path))
+        versions.sort(reverse=True)
+        return [(file_hash, path) for _, file_hash, path in versions]
+
+    def _prune_sync(self, name, current_hash):
+        """Оставляет раздаваемые и keep_versions - 1 предыдущих версий вместе с их патчами."""
+        serving = {current_hash, *self._versions.get(name, {})}
+        previous = [v for v in self._stored_versions(name) if v[0] not in serving]
+        removed = {file_hash for file_hash, _ in previous[self.keep_versions - 1:]}
+        for file_hash, path in previous[self.keep_versions - 1:]:
+            for stale in [path] + [path + ext for ext in ENCODINGS.values()]:
+                if os.path.exists(stale):
+                    os.remove(stale)
+        with self._variants_lock:
+            self._variants = {h: v for h, v in self._variants.items() if h not in removed}
+        if not removed or not os.path.isdir(self.patches_dir):
+            return
+        for entry in os.scandir(self.patches_dir):
+            from_hash, _, rest = entry.name.partition("-")
+            to_hash = rest.partition("-")[0]
+            if from_hash in removed or to_hash in removed:
+                os.remove(entry.path)
+
+    def _build_patches_sync(self, name, artifact):
+        """Строит bsdiff-патчи от предыдущих версий к опубликованной."""
+        if bsdiff4 is None:
+            return
+        os.makedirs(self.patches_dir, exist_ok=True)
+        new_data = None
+        for old_hash, old_path in self._stored_versions(name):
+            if old_hash == artifact.hash or self.patch_path(name, old_hash, artifact.hash):
+                continue
+            if new_data is None:
+                with open(artifact.path, "rb") as f:
+                    new_data = f.read()
+            with open(old_path, "rb") as f:
+                patch = bsdiff4.diff(f.read(), new_data)
+            if len(patch) > artifact.size * self.patch_max_ratio:
+                logger.info(f'Патч {old_hash[:12]} -> {artifact.hash[:12]} слишком велик, пропускаю.')
+                continue
+            path = os.path.join(
+                self.patches_dir, f"{old_hash}-{artifact.hash}-{artifact.filename}.bsdiff"
+            )
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(patch)
+            os.replace(tmp_path, path)
+            logger.info(f'Патч {old_hash[:12]} -> {artifact.hash[:12]}: {len(patch)} байт.')
+
+    def _post_publish_sync(self, name, artifact):
+        self._prune_sync(name, artifact.hash)
+        self._compress_sync(artifact)
+        self._build_patches_sync(name, artifact)
+
+    async def _post_publish(self, name, artifact):
+        """Фоновая подготовка опубликованной версии: чистка, сжатие, патчи."""
+        async with self._post_publish_lock:
+            try:
+                await run_blocking(self._post_publish_sync, name, artifact)
+            except Exception as e:
+                logger.error(f'Ошибка подготовки вариантов {artifact.filename}: {e}')
+        # Сжатые варианты готовы: остальные воркеры подхватывают их
+        await self._publish_state()
+
+    def _write_published_sync(self, data):
+        tmp_path = f"{self.published_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.published_path)
+
+    def _read_published_sync(self):
+        try:
+            with open(self.published_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f'Не удалось прочитать {self.published_path}: {e}')
+            return None
+
+    async def _publish_state(self):
+        """Лидер: записывает раздаваемые версии с хэшами чанков и оповещает остальные воркеры."""
+        if not self._leader:
+            return
+        state = {
+            name: {
+                "current": artifact.hash,
+                "versions": [json.loads(a.chunks_json) for a in self._versions.get(name, {}).values()],
+            }
+            for name, artifact in self._current.items()
+        }
+        try:
+            await run_blocking(self._write_published_sync, json.dumps(state))
+            if self._announce is not None:
+                await self._announce()
+        except Exception as e:
+            logger.error(f'Не удалось оповестить воркеры о публикации: {e}')
+
+    def _restore_version_sync(self, name, chunks):
+        """Снимок версии по хэшам чанков, посчитанным лидером, — без повторного чтения файла."""
+        file_hash = chunks["sha256"]
+        if chunks.get("chunk_size") != self.chunk_size:
+            return self._load_version_sync(name, file_hash)
+        path = os.path.join(self.store_dir, f"{file_hash}-{self.artifacts[name]}")
+        if not os.path.exists(path):
+            logger.warning(f'Версия {file_hash[:12]} {self.artifacts[name]} отсутствует в хранилище.')
+            return None
+        chunk_hashes = [bytes.fromhex(h) for h in chunks["chunks"]]
+        return self._make_artifact(name, path, file_hash, chunks["size"], chunk_hashes, None, 0)
+
+    def _find_variants_sync(self, artifacts):
+        """Сжатые варианты, уже подготовленные лидером (сами не сжимаем)."""
+        found = {}
+        for artifact in artifacts:
+            found[artifact.hash] = {
+                encoding: artifact.path + ext for encoding, ext in ENCODINGS.items()
+                if os.path.exists(artifact.path + ext)
+            }
+        with self._variants_lock:
+            self._variants = {**self._variants, **found}
+
+    async def sync(self):
+        """Подхватывает версии, опубликованные лидером (вызывается по рассылке "publish")."""
+        if self._leader:
+            return
+        published = await run_blocking(self._read_published_sync)
+        if published is None:
+            return
+        if self.rollout is not None:
+            await self.rollout.reload()
+        for name in self.artifacts:
+            entry = published.get(name)
+            if entry is None:
+                if name in self._current:
+                    await self._swap(name, None)
+                continue
+            known = self._versions.get(name, {})
+            versions = {}
+            for chunks in entry["versions"]:
+                artifact = known.get(chunks["sha256"])
+                if artifact is None:
+                    artifact = await run_blocking(self._restore_version_sync, name, chunks)
+                if artifact is not None:
+                    versions[artifact.hash] = artifact
+            artifact = versions.pop(entry["current"], None)
+            if artifact is None:
+                continue
+            stable = next(iter(versions.values()), None)
+            await run_blocking(self._find_variants_sync, [a for a in (artifact, stable) if a])
+            await self._swap(name, artifact, stable)
+        # Когорты раскатки тоже могли сдвинуться
+        await self.notify()
+
+    def _source_path(self, name):
+        return os.path.join(self.build_dir, self.artifacts[name])
+
+    def _artifact_version(self, name, file_hash):
+        if name == "loader":
+            return LOADER_VERSION
+        return file_hash[:12]
+
+    def _publish_sync(self, name):
+        """Копирует сборку в хранилище версий, считая хэш и хэши чанков за один проход."""
+        filename = self.artifacts[name]
+        src = self._source_path(name)
+        try:
+            before = os.stat(src)
+        except FileNotFoundError:
+            return None
+        current = self._current.get(name)
+        if current is not None and current.source_stat == stat_key(before):
+            return current
+        if time.time() - before.st_mtime < self.settle_delay:
+            raise ArtifactNotReady(filename)
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = os.path.join(self.store_dir, f".{filename}.{os.getpid()}.tmp")
+        sha256 = hashlib.sha256()
+        chunk_hashes = []
+        size = 0
+        try:
+            with open(src, "rb") as fin, open(tmp_path, "wb") as fout:
+                for chunk in iter(lambda: fin.read(self.chunk_size), b""):
+                    sha256.update(chunk)
+                    chunk_hashes.append(hashlib.sha256(chunk).digest())
+                    fout.write(chunk)
+                    size += len(chunk)
+            after = os.stat(src)
+            if stat_key(after) != stat_key(before) or size != after.st_size:
+                raise ArtifactNotReady(filename)
+            file_hash = sha256.hexdigest()
+            path = os.path.join(self.store_dir, f"{file_hash}-{filename}")
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        if current is not None and current.hash == file_hash:
+            return current._replace(source_stat=stat_key(after))
+        self._generation += 1
+        return self._make_artifact(name, path, file_hash, size, chunk_hashes,
+                                   stat_key(after), self._generation)
+
+    def _load_version_sync(self, name, file_hash):
+        """Восстанавливает снимок версии из хранилища (stable после перезапуска сервера)."""
+        filename = self.artifacts[name]
+        path = os.path.join(self.store_dir, f"{file_hash}-{filename}")
+        if not os.path.exists(path):
+            logger.warning(f'Версия {file_hash[:12]} {filename} отсутствует в хранилище.')
+            return None
+        sha256 = hashlib.sha256()
+        chunk_hashes = []
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                sha256.update(chunk)
+                chunk_hashes.append(hashlib.sha256(chunk).digest())
+                size += len(chunk)
+        if sha256.hexdigest() != file_hash:
+            logger.error(f'Версия {file_hash[:12]} {filename} в хранилище повреждена.')
+            return None
+        artifact = self._make_artifact(name, path, file_hash, size, chunk_hashes, None, 0)
+        self._compress_sync(artifact)
+        return artifact
+
+    def _make_artifact(self, name, path, file_hash, size, chunk_hashes, source_stat, generation):
+        filename = self.artifacts[name]
+        signatures = self._sign(file_hash.encode())
+        version = self._artifact_version(name, file_hash)
+        info = {
+            "filename": filename,
+            "hash": file_hash,
+            "size": size,
+            **signatures,
+        }
+        if name == "loader":
+            info["version"] = version
+        root = merkle_root(chunk_hashes)
+        chunks = {
+            "name": name,
+            "sha256": file_hash,
+            "size": size,
+            "chunk_size": self.chunk_size,
+            "chunks": [h.hex() for h in chunk_hashes],
+            "merkle_root": root,
+            **self._sign(root.encode()),
+        }
+        return Artifact(
+            name=name,
+            filename=filename,
+            path=path,
+            hash=file_hash,
+            size=size,
+            signature=signatures["signature"],
+            version=version,
+            generation=generation,
+            published_at=time.time(),
+            source_stat=source_stat,
+            etag=f'"{file_hash}"',
+            info=info,
+            info_json=json.dumps(info).encode(),
+            chunk_size=self.chunk_size,
+            merkle_root=root,
+            chunks_json=json.dumps(chunks).encode(),
+        )
+
+    async def refresh(self, name):
+        """Перепубликует артефакт, если файл в BUILD_DIR изменился."""
+        for _ in range(PUBLISH_RETRIES):
+            try:
+                artifact = await self._flights.run(("publish", name), self._publish_sync, name)
+            except ArtifactNotReady:
+                await asyncio.sleep(self.settle_delay)
+                continue
+            except Exception as e:
+                logger.error(f'Ошибка публикации {self.artifacts[name]}: {e}')
+                return self.latest(name)
+            current = self.latest(name)
+            if artifact is current:
+                return artifact
+            try:
+                stable = await self._stable_for(name, artifact)
+                await self._swap(name, artifact, stable)
+            except Exception as e:
+                logger.error(f'Ошибка подписи манифеста: {e}')
+                return current
+            if artifact is None:
+                logger.warning(f'{self.artifacts[name]} удалён из {self.build_dir}, публикация снята.')
+            elif current is None or current.hash != artifact.hash:
+                logger.info(
+                    f'Опубликован {artifact.filename}: {artifact.hash[:12]} '
+                    f'({artifact.size} байт, версия {artifact.generation}).'
+                )
+                task = asyncio.create_task(self._post_publish(name, artifact))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            if artifact is None or current is None or current.hash != artifact.hash:
+                await self._publish_state()
+            return artifact
+        logger.warning(f'{self.artifacts[name]} всё ещё изменяется, публикация отложена.')
+        return self.latest(name)
+
+    async def _stable_for(self, name, artifact):
+        """Stable-версия, которую нужно раздавать рядом с artifact, пока идёт раскатка."""
+        if artifact is None or self.rollout is None:
+            return None
+        stable_hash = await self.rollout.on_publish(name, artifact.hash)
+        if stable_hash == artifact.hash:
+            return None
+        stable = self.version(name, stable_hash)
+        if stable is None:
+            stable = await self._flights.run(("load", name, stable_hash),
+                                             self._load_version_sync, name, stable_hash)
+        return stable
+
+    async def refresh_all(self):
+        for name in self.artifacts:
+            await self.refresh(name)
+
+    def _changed_names(self):
+        changed = []
+        for name in self.artifacts:
+            current = self.latest(name)
+            try:
+                key = stat_key(os.stat(self._source_path(name)))
+            except FileNotFoundError:
+                key = None
+            if current is None and key is not None:
+                changed.append(name)
+            elif current is not None and current.source_stat != key:
+                changed.append(name)
+        return changed
+
+    async def _watch_events(self):
+        names = {filename: name for name, filename in self.artifacts.items()}
+        async for changes in awatch(self.build_dir):
+            touched = {names[os.path.basename(path)] for _, path in changes
+                       if os.path.basename(path) in names}
+            for name in touched:
+                await self.refresh(name)
+
+    async def _watch_polling(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for name in self._changed_names():
+                await self.refresh(name)
+
+    async def watch_rollout(self):
+        """
+        Когорты раскатки сдвигаются по времени: будим long-poll запросы.
+        Сдвиг одинаково считает каждый воркер, сохраняет его только лидер.
+        """
+        while True:
+            await asyncio.sleep(ROLLOUT_TICK_INTERVAL)
+            if self.rollout.tick():
+                if self._leader:
+                    await self.rollout.flush()
+                await self.notify()
+
+    async def run(self, announce=None):
+        """
+        Первичная публикация и наблюдение за BUILD_DIR (inotify или опрос stat).
+        announce() — оповестить остальные воркеры, что published.json обновлён.
+        """
+        self._leader = True
+        self._announce = announce
+        try:
+            await self._run()
+        finally:
+            self._leader = False
+            self._announce = None
+
+    async def _run(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        os.makedirs(self.store_dir, exist_ok=True)
+        await self.refresh_all()
+        if awatch is not None:
+            try:
+                logger.info(f'Наблюдение за {self.build_dir} (inotify).')
+                await self._watch_events()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'inotify недоступен ({e}), переключаюсь на опрос.')
+        logger.info(f'Наблюдение за {self.build_dir} (опрос каждые {self.poll_interval}s).')
+        await self._watch_polling()
+
+
+publisher = ArtifactPublisher(
+    build_dir=BUILD_PATH,
+    store_dir=STORE_PATH,
+    artifacts={"client": BUILD_CLIENT_FILE, "loader": BUILD_LOADER_FILE},
+    urls={
+        "client": {
+            "url": "/download_client",
+            "patch_url": "/client_patch",
+            "chunks_url": "/client_chunks",
+        },
+        "loader": {
+            "url": "/loader_download",
+            "patch_url": "/loader_patch",
+            "chunks_url": "/loader_chunks",
+        },
+    },
+    priv_key_path=SIGN_PRIV_PATH,
+    ed25519_key_path=SIGN_ED25519_PRIV_PATH,
+    rollout=rollout,
+)
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import deque
+
+from utils.config_loader import IDLE_TICK, IDLE_TIMEOUT, OUTBOX_OVERFLOW, OUTBOX_SIZE
+from utils.timing_wheel import TimingWheel
+
+logger = logging.getLogger("bot_server")
+
+# Ограничения на метаданные от клиента: память на сессию не растёт от query-параметров
+MAX_TAGS = 16
+MAX_LABEL_LENGTH = 64
+# Коды закрытия: тот же client_id подключился заново / сессия молчала дольше idle_timeout /
+# клиент не успевает забирать сообщения (outbox_overflow = disconnect)
+CLOSE_REPLACED = 4000
+CLOSE_IDLE = 4001
+CLOSE_OVERFLOW = 4002
+# Задачи закрытия сессий, чтобы их не собрал сборщик мусора до завершения
+_closing = set()
+
+
+class OutboxFull(Exception):
+    """Очередь отправки сессии переполнена, сообщение не принято."""
+
+
+class Session:
+    """Живое подключение клиента. __slots__: без __dict__ запись занимает фиксированный объём."""
+
+    __slots__ = ("client_id", "websocket", "connected_at", "last_seen", "version", "tags",
+                 "messages_in", "messages_out", "bytes_in", "bytes_out", "dropped",
+                 "_lanes", "_writer")
+
+    def __init__(self, client_id, websocket, version=None, tags=()):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.connected_at = time.time()
+        # monotonic: для поиска зависших подключений не важны переводы часов
+        self.last_seen = time.monotonic()
+        self.version = version
+        self.tags = tags
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped = 0
+        # Очереди (срочная, обычная) и задача-писатель создаются при первой отправке:
+        # молчащая сессия не держит ни deque, ни задачу
+        self._lanes = None
+        self._writer = None
+
+    def received(self, size):
+        self.last_seen = time.monotonic()
+        self.messages_in += 1
+        self.bytes_in += size
+
+    async def send_json(self, data):
+        """Прямая запись в сокет; ждёт, пока её примет TCP-буфер."""
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        await self.websocket.send_text(text)
+        self.messages_out += 1
+        self.bytes_out += len(text)
+
+    def enqueue(self, data, urgent=False):
+        """
+        Ставит сообщение в очередь и сразу возвращается: медленный клиент не держит
+        отправителя. urgent — срочная очередь, она уходит раньше обычной.
+        При переполнении действует OUTBOX_OVERFLOW; отказ — OutboxFull.
+        """
+        if self._lanes is None:
+            self._lanes = (deque(), deque())
+        urgent_lane, normal_lane = self._lanes
+        if len(urgent_lane) + len(normal_lane) >= OUTBOX_SIZE:
+            self.dropped += 1
+            if OUTBOX_OVERFLOW == "disconnect":
+                self.close(CLOSE_OVERFLOW)
+                raise OutboxFull('Клиент не успевает принимать сообщения, сессия закрыта')
+            # Вытесняется обычное сообщение; срочные — только ради другого срочного
+            victim = normal_lane or (urgent_lane if urgent else None)
+            if OUTBOX_OVERFLOW == "reject" or victim is None:
+                raise OutboxFull('Очередь отправки ПК переполнена')
+            victim.popleft()
+        (urgent_lane if urgent else normal_lane).append(data)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        urgent_lane, normal_lane = self._lanes
+        try:
+            while urgent_lane or normal_lane:
+                await self.send_json((urgent_lane or normal_lane).popleft())
+        except Exception as e:
+            logger.warning(f'({self.client_id}) Ошибка отправки, очередь сброшена: {e}')
+            self.dropped += len(urgent_lane) + len(normal_lane)
+            urgent_lane.clear()
+            normal_lane.clear()
+        finally:
+            # Опустевшие очереди не держим до следующей отправки
+            self._lanes = None
+            self._writer = None
+
+    def close(self, code):
+        """Закрывает сокет в фоне: полуоткрытый клиент не задерживает вызывающего на close_timeout."""
+        task = asyncio.create_task(self._close(code))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+    async def _close(self, code):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            # Сокет уже закрыт другой стороной
+            pass
+
+
+def _label(value):
+    """Версия/тег из query-параметра: обрезка и интернирование (одна строка на весь парк)."""
+    value = (value or "").strip()[:MAX_LABEL_LENGTH]
+    return sys.intern(value) if value else None
+
+
+def parse_tags(raw):
+    """Теги через запятую -> отсортированный кортеж без повторов, не больше MAX_TAGS."""
+    tags = {_label(tag) for tag in (raw or "").split(",")}
+    tags.discard(None)
+    return tuple(sorted(tags)[:MAX_TAGS])
+
+
+class ConnectionRegistry:
+    """
+    Подключённые клиенты по client_id с индексами по тегу и версии.
+    Повторное подключение с тем же client_id вытесняет старую сессию:
+    побеждает последнее подключение, старое возвращается вызывающему для закрытия.
+    Сроки простоя сессий лежат в колесе таймеров: received() только обновляет
+    last_seen, а срок переносится лениво, когда до него доходит колесо.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, idle_tick=IDLE_TICK):
+        self._sessions = {}
+        self._by_tag = {}
+        self._by_version = {}
+        self.idle_timeout = idle_timeout
+        # Ячеек на один оборот за idle_timeout: срок почти всегда срабатывает с первого прохода
+        self._idle = TimingWheel(idle_tick, min(int(idle_timeout / idle_tick) + 1, 4096))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, client_id):
+        return client_id in self._sessions
+
+    def ids(self):
+        return list(self._sessions)
+
+    def get(self, client_id):
+        return self._sessions.get(client_id)
+
+    def by_tag(self, tag):
+        return list(self._by_tag.get(tag, ()))
+
+    def by_version(self, version):
+        return list(self._by_version.get(version, ()))
+
+    def tags(self):
+        return {tag: len(sessions) for tag, sessions in self._by_tag.items()}
+
+    def versions(self):
+        return {version: len(sessions) for version, sessions in self._by_version.items()}
+
+    def register(self, client_id, websocket, version=None, tags=""):
+        """Новая сессия и вытесненная старая (или None)."""
+        session = Session(client_id, websocket, _label(version), parse_tags(tags))
+        evicted = self._sessions.get(client_id)
+        if evicted is not None:
+            self._unindex(evicted)
+        self._sessions[client_id] = session
+        if self.idle_timeout > 0:
+            self._idle.schedule(session, session.last_seen + self.idle_timeout)
+        self._by_version.setdefault(session.version, set()).add(session)
+        for tag in session.tags:
+            self._by_tag.setdefault(tag, set()).add(session)
+        return session, evicted
+
+    def unregister(self, session):
+        """Удаляет сессию, только если её ещё не вытеснило новое подключение."""
+        if self._sessions.get(session.client_id) is not session:
+            return False
+        del self._sessions[session.client_id]
+        self._unindex(session)
+        return True
+
+    def idle_sessions(self, now=None):
+        """Сессии без входящих кадров дольше idle_timeout; активные получают новый срок."""
+        now = time.monotonic() if now is None else now
+        idle = []
+        for session in self._idle.advance(now):
+            deadline = session.last_seen + self.idle_timeout
+            if deadline > now:
+                self._idle.schedule(session, deadline)
+            else:
+                idle.append(session)
+        return idle
+
+    def _unindex(self, session):
+        self._idle.cancel(session)
+        self._discard(self._by_version, session.version, session)
+        for tag in session.tags:
+            self._discard(self._by_tag, tag, session)
+
+    @staticmethod
+    def _discard(index, key, session):
+        sessions = index.get(key)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del index[key]
+
+    def memory_usage(self):
+        """Приблизительный объём записей и индексов в байтах (без самих websocket)."""
+        total = sys.getsizeof(self._sessions) + sys.getsizeof(self._by_tag) + sys.getsizeof(self._by_version)
+        for session in self._sessions.values():
+            total += sys.getsizeof(session) + sys.getsizeof(session.tags)
+            if session._lanes is not None:
+                total += sum(sys.getsizeof(lane) for lane in session._lanes)
+        for index in (self._by_tag, self._by_version):
+            total += sum(sys.getsizeof(sessions) for sessions in index.values())
+        return total
+
+
+registry = ConnectionRegistry()
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from utils.blocking import run_blocking
+from utils.config_loader import (ROLLOUT_STATE_PATH, ROLLOUT_STEP_INTERVAL,
+                                 ROLLOUT_STEPS)
+
+logger = logging.getLogger("bot_server")
+
+
+def cohort(name, client_id):
+    """Детерминированная когорта 0..99 клиента для артефакта name."""
+    digest = hashlib.sha256(f"{name}:{client_id}".encode()).hexdigest()
+    return int(digest[:8], 16) % 100
+
+
+class RolloutController:
+    """
+    Поэтапная раскатка новых сборок. Новая версия (candidate) видна только
+    когортам ниже текущего процента; процент растёт по шагам steps каждые
+    step_interval секунд, пока админ не поставит раскатку на паузу.
+    Остальные loader'ы получают stable. Состояние переживает перезапуск.
+    Методы выбора и управления работают только с памятью (их зовут из запросов),
+    файл читают reload() и пишет flush() — в пуле run_blocking.
+    """
+
+    def __init__(self, state_path=ROLLOUT_STATE_PATH, steps=ROLLOUT_STEPS,
+                 step_interval=ROLLOUT_STEP_INTERVAL):
+        self.state_path = state_path
+        self.steps = steps
+        self.step_interval = step_interval
+        self._state = self._load()
+        # _dirty — есть несохранённые изменения, _moved — сдвинулись когорты (для tick())
+        self._dirty = False
+        self._moved = False
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f'Состояние раскатки повреждено, начинаю заново: {e}')
+            return {}
+
+    async def reload(self):
+        """Перечитывает состояние с диска: его мог изменить другой воркер."""
+        self._state = await run_blocking(self._load)
+        self._dirty = False
+
+    def _save_sync(self, data):
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f'Не удалось сохранить состояние раскатки: {e}')
+
+    def _mark_changed(self):
+        self._dirty = True
+        self._moved = True
+
+    async def flush(self):
+        """Записывает изменения на диск, если они есть."""
+        if not self._dirty:
+            return
+        # Снимок сериализуется в event loop: поток записи не видит состояние на середине изменения
+        data = json.dumps(self._state, indent=4)
+        self._dirty = False
+        await run_blocking(self._save_sync, data)
+
+    def tick(self):
+        """Продвигает все раскатки по времени. True — когорты сдвинулись с прошлого вызова."""
+        for name in list(self._state):
+            self._tick(name)
+        moved, self._moved = self._moved, False
+        return moved
+
+    def _tick(self, name):
+        """Продвигает раскатку по времени; на 100% кандидат становится stable."""
+        state = self._state.get(name)
+        if not state or not state.get("candidate"):
+            return state
+        # Шаг из файла состояния мог остаться от прежнего, более длинного списка steps
+        state["step"] = min(state["step"], len(self.steps) - 1)
+        now = time.time()
+        while (not state["paused"] and state["step"] < len(self.steps) - 1
+               and now - state["step_started"] >= self.step_interval):
+            state["step"] += 1
+            state["step_started"] += self.step_interval
+            self._mark_changed()
+        if state["step"] == len(self.steps) - 1 or self.steps[state["step"]] >= 100:
+            self._promote(name, state)
+        return state
+
+    def _promote(self, name, state):
+        logger.info(f'Раскатка {name} завершена: {state["candidate"][:12]} стал stable.')
+        state.update(stable=state["candidate"], candidate=None, step=0, paused=False)
+        self._mark_changed()
+
+    def stable_hashes(self):
+        """Версии, которые ещё раздаются кому-то, кроме текущей сборки."""
+        return {state["stable"] for state in self._state.values() if state.get("stable")}
+
+    async def on_publish(self, name, new_hash):
+        """Учитывает новую сборку. Возвращает hash stable-версии, которую нужно продолжать раздавать."""
+        # Файл мог изменить бот из другого процесса (пауза, откат)
+        await self.reload()
+        try:
+            return self._on_publish(name, new_hash)
+        finally:
+            await self.flush()
+
+    def _on_publish(self, name, new_hash):
+        state = self._tick(name)
+        if not state or not state.get("stable") or len(self.steps) < 2:
+            self._state[name] = {
+                "stable": new_hash, "candidate": None, "aborted": None,
+                "step": 0, "step_started": time.time(), "paused": False,
+            }
+            self._mark_changed()
+            return new_hash
+        if new_hash in (state["stable"], state["candidate"], state.get("aborted")):
+            return state["stable"]
+        state.update(candidate=new_hash, aborted=None, step=0,
+                     step_started=time.time(), paused=False)
+        self._mark_changed()
+        logger.info(f'Раскатка {name}: {new_hash[:12]} начата с {self.steps[0]}%.')
+        return state["stable"]
+
+    def select(self, name, client_id, current_hash):
+        """Какую версию отдавать клиенту: candidate по когорте, иначе stable."""
+        state = self._tick(name)
+        if not state or not state.get("candidate"):
+            return state["stable"] if state and state.get("stable") else current_hash
+        if client_id is not None and cohort(name, client_id) < self.steps[state["step"]]:
+            return state["candidate"]
+        return state["stable"]
+
+    def pause(self, name):
+        state = self._tick(name)
+        if not state or not state.get("candidate"):
+            return False
+        state["paused"] = True
+        self._mark_changed()
+        return True
+
+    def resume(self, name):
+        state = self._tick(name)
+        if not state or not state.get("candidate"):
+            return False
+        state["paused"] = False
+        state["step_started"] = time.time()
+        self._mark_changed()
+        return True
+
+    def advance(self, name, full=False):
+        """Следующий шаг раскатки (или сразу 100%)."""
+        state = self._tick(name)
+        if not state or not state.get("candidate"):
+            return False
+        last = len(self.steps) - 1
+        state["step"] = last if full else min(state["step"] + 1, last)
+        state["step_started"] = time.time()
+        if state["step"] == last or self.steps[state["step"]] >= 100:
+            self._promote(name, state)
+        else:
+            self._mark_changed()
+        return True
+
+    def abort(self, name):
+        """Откат: кандидат больше никому не раздаётся, пока не появится новая сборка."""
+        state = self._tick(name)
+        if not state or not state.get("candidate"):
+            return False
+        state.update(aborted=state["candidate"], candidate=None, step=0, paused=False)
+        self._mark_changed()
+        return True
+
+    def status(self):
+        """{name: {stable, candidate, percent, paused}} для вывода админу."""
+        result = {}
+        for name in list(self._state):
+            state = self._tick(name)
+            result[name] = {
+                "stable": state.get("stable"),
+                "candidate": state.get("candidate"),
+                "percent": self.steps[state["step"]] if state.get("candidate") else 100,
+                "paused": state.get("paused", False),
+            }
+        return result
+
+
+rollout = RolloutController()
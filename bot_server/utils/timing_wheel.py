@@ -0,0 +1,50 @@
+import time
+
+
+class TimingWheel:
+    """
+    Хэшированное колесо таймеров: slots ячеек по tick секунд. Срок ставится
+    и снимается за O(1), за тик просматривается одна ячейка — только те ключи,
+    чей срок попал в неё. Сроки дальше одного оборота ждут в ячейке следующего круга.
+    Время — time.monotonic().
+    """
+
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self._slots = [{} for _ in range(slots)]
+        self._where = {}
+        self._current = int(time.monotonic() // tick)
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, deadline):
+        """Ставит (или переносит) срок key на deadline."""
+        self.cancel(key)
+        # Ячейка тика, который целиком позже срока: к её проходу срок уже наступил,
+        # иначе ключ, поставленный внутри текущего тика, ждал бы лишний оборот
+        ticks = max(int(deadline // self.tick) + 1, self._current + 1)
+        index = ticks % len(self._slots)
+        self._slots[index][key] = deadline
+        self._where[key] = index
+
+    def cancel(self, key):
+        index = self._where.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self, now):
+        """Ключи, чей срок наступил к now; проходит ячейки с прошлого вызова."""
+        target = int(now // self.tick)
+        # После долгой паузы event loop достаточно одного полного оборота
+        start = max(self._current + 1, target - len(self._slots) + 1)
+        expired = []
+        for ticks in range(start, target + 1):
+            slot = self._slots[ticks % len(self._slots)]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self._where[key]
+            expired.extend(due)
+        self._current = max(self._current, target)
+        return expired
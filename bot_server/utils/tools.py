@@ -1,25 +1,59 @@
 import base64
 import hashlib
+import json
+import os
+from functools import lru_cache
 
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding
 
 
-def compute_file_hash(path):
-    sha256 = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256.update(chunk)
-    return sha256.hexdigest()
+@lru_cache(maxsize=8)
+def _load_private_key(privkey_path: str, mtime_ns: int):
+    with open(privkey_path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+def load_private_key(privkey_path):
+    """Разобранный приватный ключ; PEM перечитывается, только если файл ключа изменился."""
+    return _load_private_key(str(privkey_path), os.stat(privkey_path).st_mtime_ns)
 
 
 def sign_hash_with_rsa(privkey_path: str, data_bytes: bytes) -> str:
     """Подписывает bytes (обычно хэш) приватным ключом RSA, возвращает base64 подпись."""
-    with open(privkey_path, "rb") as f:
-        priv = serialization.load_pem_private_key(f.read(), password=None)
+    priv = load_private_key(privkey_path)
     signature = priv.sign(
         data_bytes,
         padding.PKCS1v15(),
         hashes.SHA256()
     )
     return base64.b64encode(signature).decode()
+
+
+def sign_with_ed25519(privkey_path: str, data_bytes: bytes) -> str:
+    """Подписывает bytes приватным ключом Ed25519, возвращает base64 подпись."""
+    priv = load_private_key(privkey_path)
+    if not isinstance(priv, ed25519.Ed25519PrivateKey):
+        raise ValueError(f'{privkey_path} не является ключом Ed25519')
+    return base64.b64encode(priv.sign(data_bytes)).decode()
+
+
+def canonical_json(obj) -> bytes:
+    """Детерминированная сериализация JSON для подписи."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=True).encode()
+
+
+def merkle_root(leaves) -> str:
+    """Корень Merkle-дерева над sha256 чанков (непарный узел поднимается на уровень выше)."""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
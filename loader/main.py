@@ -1,39 +1,62 @@
 """
 Отказоустойчивая версия loader:
-- атомарная загрузка клиента (tmp .part)
+- атомарная загрузка клиента (tmp .part) с докачкой и бинарными патчами
+- параллельная загрузка чанков с проверкой по подписанному Merkle-корню
 - проверка размера / sha256
-- проверка RSA-подписи метаданных (signature)
-- запуск клиента в фоне, без окна (win) / setsid (unix)
-- мониторинг и перезапуск клиента при падении
+- проверка подписи метаданных: Ed25519 (signature_ed25519) или RSA (signature)
+- единый HTTP-транспорт: keep-alive сессия, раздельные таймауты, политики повторов
+- asyncio-ядро: клиент, проверка обновлений и остановка обрабатываются одним event loop
+- запуск клиента в фоне, без окна (win) / отдельная сессия (unix)
+- перезапуск клиента с экспоненциальной паузой, crash loop сообщается серверу
+- новая версия скачивается, пока работает старая; клиент останавливается только на установку
 - одна копия loader (pidfile lock)
-- автообновление loader (через /loader_info и /loader_download)
+- автообновление loader (через /loader_download)
+- один подписанный /manifest на цикл проверки для клиента и loader
+- long-poll /manifest?wait=: сервер отвечает сразу после публикации новой версии
+- быстрый старт: клиент запускается по сохранённому подписанному манифесту, не дожидаясь сервера
 """
 
+import asyncio
 import base64
 import hashlib
+import json
 import logging
 import os
 import platform
+import random
+import re
+import signal
 import subprocess
 import sys
 import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import ed25519, padding
+
+try:
+    import bsdiff4
+except ImportError:
+    bsdiff4 = None
 
 BASE_DIR = Path(__file__).resolve().parent
 APP_NAME = "RemotePCLoader"
 PIDFILE = BASE_DIR / f"{APP_NAME}.pid"
+HASH_CACHE_PATH = BASE_DIR / f"{APP_NAME}.hashes.json"
+MANIFEST_CACHE_PATH = BASE_DIR / f"{APP_NAME}.manifest.json"
+CLIENT_CONFIG_PATH = BASE_DIR / "config.json"
 
 SERVER_BASE = "http://127.0.0.1:1337"
-CLIENT_INFO_URL = f"{SERVER_BASE}/client_info"
-CLIENT_DOWNLOAD_URL = f"{SERVER_BASE}/download_client"
-LOADER_INFO_URL = f"{SERVER_BASE}/loader_info"
-LOADER_DOWNLOAD_URL = f"{SERVER_BASE}/loader_download"
+MANIFEST_URL = f"{SERVER_BASE}/manifest"
 
 CLIENT_FILENAME = "pc_client.exe"
 SAVE_CLIENT_PATH = str(BASE_DIR / CLIENT_FILENAME)
@@ -43,11 +66,28 @@ LOADER_FILENAME = Path(sys.argv[0]).name
 LOADER_TMP_NAME = LOADER_FILENAME + ".new"
 LOADER_TMP_PATH = str(BASE_DIR / LOADER_TMP_NAME)
 
-MAX_RETRIES = 5
-RETRY_DELAY = 2
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+DOWNLOAD_READ_TIMEOUT = 60
 CHECK_INTERVAL = 30
+MIN_CHECK_INTERVAL = 5
+MAX_CHECK_INTERVAL = 3600
+CHECK_JITTER = 0.2
+LONG_POLL_WAIT = 55
+# Новую сборку все loader'ы узнают одновременно: начало загрузки разносится на случайные 0..N секунд
+UPDATE_SPREAD = 10
 CLIENT_MONITOR_RESTART_DELAY = 3
+CLIENT_RESTART_MAX_DELAY = 300
+# Клиент, проработавший дольше, считается стабильным: счётчик падений сбрасывается
+CLIENT_STABLE_UPTIME = 60
+CRASH_LOOP_THRESHOLD = 5
 MIN_CLIENT_SIZE = 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PARALLEL_DOWNLOADS = 4
+CHUNK_RETRIES = 3
+# bsdiff4 держит в памяти старую и новую версии целиком: крупнее — только чанки и поток
+MAX_PATCH_FILE_SIZE = 32 * 1024 * 1024
+MAX_RETRY_AFTER = 300
 LOADER_VERSION = "1"
 
 PUB_KEY_PEM = b"""
@@ -66,6 +106,9 @@ JzPE8SVPcoanvNVtn/GvdUDJHvfsrhA1zdlNrKBRnwecHCfhexx7whYML2NYhBFJ
 5xKJNxtbwYO17ZiLjWkC8UECAwEAAQ==
 -----END PUBLIC KEY-----
 """
+# Публичный ключ Ed25519 (python -m utils.keygen на сервере). Пока он не задан
+# или сервер не прислал signature_ed25519, проверяется RSA-подпись.
+ED25519_PUB_KEY_PEM = None
 
 
 def setup_logger(log=True, files=True):
@@ -92,15 +135,99 @@ def setup_logger(log=True, files=True):
 logger = setup_logger(log=True, files=False)
 
 
-def safe_request(url, timeout=10):
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = requests.get(url, timeout=timeout)
-            return resp
-        except Exception as e:
-            logger.error(f"Не удалось подключиться к {url} ({attempt}/{MAX_RETRIES}).")
-            time.sleep(RETRY_DELAY)
-    return None
+class RetryPolicy:
+    """Сколько раз повторять запрос и сколько ждать между попытками (экспонента с разбросом)."""
+    def __init__(self, attempts, base_delay=1.0, max_delay=30.0, multiplier=2.0,
+                 jitter=0.5, retry_statuses=(502, 503, 504)):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+POLL_RETRY = RetryPolicy(attempts=3, base_delay=1, max_delay=5)
+DOWNLOAD_RETRY = RetryPolicy(attempts=5, base_delay=2, max_delay=30)
+
+
+def retry_after_delay(resp):
+    """Пауза из Retry-After (секунды) — сервер так разводит волну загрузок по времени."""
+    value = resp.headers.get("Retry-After", "").strip()
+    if not value.isdigit():
+        return 0
+    return min(int(value), MAX_RETRY_AFTER)
+
+
+class Transport:
+    """
+    Единый HTTP-транспорт loader: одна keep-alive сессия на все запросы,
+    раздельные таймауты подключения и чтения, политика повторов на вызов.
+    Паузы между повторами прерываются close(), поэтому не держат поток при выходе.
+    """
+    def __init__(self, base_url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=4):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._closed = threading.Event()
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path
+
+    def get(self, path, headers=None, params=None, stream=False, retry=POLL_RETRY,
+            read_timeout=None):
+        return self.request("GET", path, headers=headers, params=params, stream=stream,
+                            retry=retry, read_timeout=read_timeout)
+
+    def post(self, path, json=None, retry=POLL_RETRY):
+        return self.request("POST", path, json=json, retry=retry)
+
+    def request(self, method, path, headers=None, params=None, json=None, stream=False,
+                retry=POLL_RETRY, read_timeout=None):
+        """
+        Запрос с повторами по политике retry. Возвращает последний ответ
+        (в том числе с ошибочным статусом) или None, если сервер недоступен.
+        """
+        url = self.url(path)
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        for attempt in range(1, retry.attempts + 1):
+            if self._closed.is_set():
+                return None
+            delay = retry.delay(attempt)
+            try:
+                resp = self.session.request(method, url, headers=headers, params=params,
+                                            json=json, stream=stream, timeout=timeout)
+            except requests.RequestException as e:
+                logger.error(f"Не удалось подключиться к {url} ({attempt}/{retry.attempts}): {e}")
+            else:
+                if resp.status_code not in retry.retry_statuses or attempt == retry.attempts:
+                    return resp
+                logger.warning(f"{url} ответил {resp.status_code} ({attempt}/{retry.attempts}).")
+                resp.close()
+                delay = max(delay, retry_after_delay(resp))
+            if attempt < retry.attempts:
+                self._closed.wait(delay)
+        return None
+
+    def close(self):
+        self._closed.set()
+        self.session.close()
+
+
+transport = Transport(SERVER_BASE)
 
 
 def compute_file_hash(path):
@@ -115,22 +242,126 @@ def compute_file_hash(path):
         return None
 
 
+# Кэш sha256 локальных файлов: путь -> {stat: [size, mtime_ns, inode], hash}
+_hash_cache = None
+_hash_cache_lock = threading.Lock()
+
+
+def _stat_signature(st):
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def _load_hash_cache():
+    global _hash_cache
+    if _hash_cache is None:
+        try:
+            _hash_cache = json.loads(HASH_CACHE_PATH.read_text(encoding="utf-8"))
+            if not isinstance(_hash_cache, dict):
+                _hash_cache = {}
+        except FileNotFoundError:
+            _hash_cache = {}
+        except Exception as e:
+            logger.warning(f"Кэш хэшей повреждён, начинаю заново: {e}")
+            _hash_cache = {}
+    return _hash_cache
+
+
+def remember_file_hash(path, digest, stat_path=None):
+    """
+    Запоминает уже проверенный хэш файла вместе с его текущим stat.
+    stat_path — файл, который ещё будет переименован в path (stat при rename сохраняется).
+    """
+    key = str(Path(path).resolve())
+    try:
+        signature = _stat_signature(os.stat(stat_path or key))
+    except OSError:
+        return
+    with _hash_cache_lock:
+        cache = _load_hash_cache()
+        cache[key] = {"stat": signature, "hash": digest}
+        try:
+            tmp = HASH_CACHE_PATH.with_suffix(".tmp")
+            tmp.write_text(json.dumps(cache), encoding="utf-8")
+            tmp.replace(HASH_CACHE_PATH)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кэш хэшей: {e}")
+
+
+def cached_file_hash(path):
+    """
+    sha256 файла без повторного чтения, если размер, mtime_ns и inode
+    не изменились с последнего вычисления; иначе считает и запоминает.
+    """
+    key = str(Path(path).resolve())
+    try:
+        signature = _stat_signature(os.stat(key))
+    except OSError:
+        return None
+    with _hash_cache_lock:
+        item = _load_hash_cache().get(key)
+        if item and item.get("stat") == signature:
+            return item.get("hash")
+    digest = compute_file_hash(key)
+    if digest:
+        remember_file_hash(key, digest)
+    return digest
+
+
+def canonical_json(obj):
+    """Та же сериализация, что и при подписи манифеста на сервере."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=True).encode()
+
+
+def merkle_root(leaves):
+    """Корень Merkle-дерева над sha256 чанков, как его считает сервер."""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        parents = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
+
+@lru_cache(maxsize=4)
+def load_public_key(pubkey_pem):
+    """Разбор PEM один раз за запуск: RSA-4096 разбирается заметно дольше Ed25519."""
+    return serialization.load_pem_public_key(pubkey_pem)
+
+
 def verify_signature(pubkey_pem, data_bytes, signature_b64):
     try:
-        public_key = serialization.load_pem_public_key(pubkey_pem)
+        public_key = load_public_key(pubkey_pem)
         signature = base64.b64decode(signature_b64)
-        public_key.verify(
-            signature,
-            data_bytes,
-            padding.PKCS1v15(),
-            hashes.SHA256()
-        )
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            public_key.verify(signature, data_bytes)
+        else:
+            public_key.verify(
+                signature,
+                data_bytes,
+                padding.PKCS1v15(),
+                hashes.SHA256()
+            )
         return True
     except Exception as e:
         logger.error(f"Signature verify failed: {e}")
         return False
 
 
+def verify_signed(data_bytes, signatures):
+    """Проверяет Ed25519-подпись, если есть ключ и подпись, иначе RSA (переходный период)."""
+    if ED25519_PUB_KEY_PEM and signatures.get("signature_ed25519"):
+        return verify_signature(ED25519_PUB_KEY_PEM, data_bytes, signatures["signature_ed25519"])
+    if not signatures.get("signature"):
+        return False
+    return verify_signature(PUB_KEY_PEM, data_bytes, signatures["signature"])
+
+
 def is_process_running(pid):
     try:
         os.kill(pid, 0)
@@ -168,45 +399,146 @@ def release_pidfile():
         logger.warning(f"Не удалось удалить PID файл: {e}")
 
 
-def get_client_info():
-    """Получение метаданных клиента."""
-    logger.info("Получение информации о клиенте...")
-    r = safe_request(CLIENT_INFO_URL)
+def get_client_id():
+    """client_id из config.json клиента или тот же uuid, что клиент создаст при первом запуске."""
+    try:
+        with open(CLIENT_CONFIG_PATH, "r", encoding="utf-8") as f:
+            client_id = json.load(f).get("client_id")
+        if client_id:
+            return client_id
+    except Exception:
+        pass
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, platform.node() + platform.system()))
+
+
+# Последний проверенный манифест и его ETag для условных запросов (If-None-Match),
+# а также рекомендованный сервером интервал опроса
+_manifest_cache = {"etag": None, "entries": None, "poll_interval": CHECK_INTERVAL}
+
+
+def parse_poll_interval(resp):
+    """Интервал опроса из Cache-Control: max-age или Retry-After (в секундах)."""
+    match = re.search(r"max-age=(\d+)", resp.headers.get("Cache-Control", ""))
+    value = match.group(1) if match else resp.headers.get("Retry-After", "")
+    if not value.strip().isdigit():
+        return None
+    return min(max(int(value), MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL)
+
+
+def next_poll_delay():
+    """Интервал до следующей проверки со случайным разбросом, чтобы loader'ы не опрашивали синхронно."""
+    interval = _manifest_cache["poll_interval"]
+    return interval * random.uniform(1 - CHECK_JITTER, 1 + CHECK_JITTER)
+
+
+def get_manifest(wait=0):
+    """
+    Получение подписанного манифеста всех артефактов.
+    wait > 0 — long-poll: сервер держит запрос до wait секунд, пока манифест не изменится.
+    Возвращает {name: entry} или None, если сервер недоступен или подпись неверна.
+    """
+    logger.info("Получение манифеста...")
+    headers = {}
+    # client_id определяет когорту поэтапной раскатки новых версий
+    params = {"client_id": get_client_id()}
+    if _manifest_cache["etag"] and _manifest_cache["entries"] is not None:
+        headers["If-None-Match"] = _manifest_cache["etag"]
+        if wait:
+            params["wait"] = wait
+    else:
+        wait = 0
+    r = transport.get(MANIFEST_URL, headers=headers, params=params, retry=POLL_RETRY,
+                      read_timeout=READ_TIMEOUT + wait)
+    if r is not None:
+        interval = parse_poll_interval(r)
+        if interval:
+            _manifest_cache["poll_interval"] = interval
+    if r is not None and r.status_code == 304:
+        logger.info("Манифест не изменился.")
+        return _manifest_cache["entries"]
     if not r:
         logger.error("Сервер недоступен.")
         return None
     try:
-        logger.info("Информация получена.")
-        info = r.json()
+        data = r.json()
     except Exception as e:
         logger.error(f"Сервер вернул некорректные данные: {e}")
         return None
-    if "error" in info:
-        logger.error(f"Ошибка сервера: {info['error']}")
+    if "error" in data:
+        logger.error(f"Ошибка сервера: {data['error']}")
+        return None
+    entries = parse_signed_manifest(data)
+    if entries is None:
+        return None
+    _manifest_cache["etag"] = r.headers.get("ETag")
+    _manifest_cache["entries"] = entries
+    save_manifest(_manifest_cache["etag"], data)
+    logger.info("Манифест получен.")
+    return entries
+
+
+def parse_signed_manifest(data):
+    """Проверяет подпись ответа /manifest и возвращает {name: entry} или None."""
+    manifest = data.get("manifest") if isinstance(data, dict) else None
+    if not isinstance(manifest, dict) or not (data.get("signature") or data.get("signature_ed25519")):
+        logger.error("Ответ сервера неполный (нужны manifest, signature).")
+        return None
+    if not verify_signed(canonical_json(manifest), data):
+        logger.error("Подпись манифеста не валидна.")
+        return None
+    required = {"name", "filename", "version", "size", "sha256", "url"}
+    entries = {}
+    for entry in manifest.get("artifacts", []):
+        if not isinstance(entry, dict) or not all(k in entry for k in required):
+            logger.error("Запись манифеста неполная, пропускаю.")
+            continue
+        entries[entry["name"]] = entry
+    return entries
+
+
+def save_manifest(etag, data):
+    """Сохраняет проверенный ответ /manifest вместе с подписями для следующего запуска."""
+    try:
+        tmp = MANIFEST_CACHE_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"etag": etag, "data": data}), encoding="utf-8")
+        tmp.replace(MANIFEST_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить манифест: {e}")
+
+
+def load_cached_manifest():
+    """
+    Манифест с прошлого запуска. Подпись проверяется заново, поэтому подменённый
+    на диске файл не будет принят. Возвращает {name: entry} или None.
+    """
+    try:
+        cached = json.loads(MANIFEST_CACHE_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Сохранённый манифест повреждён: {e}")
         return None
-    required = {"filename", "hash", "size", "signature"}
-    if not all(k in info for k in required):
-        logger.error("Ответ сервера неполный (нужны filename, hash, size, signature).")
+    entries = parse_signed_manifest(cached.get("data"))
+    if entries is None:
+        logger.warning("Сохранённый манифест не прошёл проверку, жду сервер.")
         return None
-    return info
+    # ETag позволяет первому запросу к серверу получить дешёвый 304
+    _manifest_cache["etag"] = cached.get("etag")
+    _manifest_cache["entries"] = entries
+    return entries
 
 
-def check_client():
+def check_client(entry):
     """
-    Проверка необходимости скачивания клиента.
+    Проверка необходимости скачивания клиента по записи манифеста.
     True -> нужно скачать/обновить клиент
     False -> клиент актуален или сервер недоступен и локальный файл есть
     """
-    info = get_client_info()
-    if not info:
+    if not entry:
         logger.warning("Проверка версии невозможна, сервер недоступен.")
         return not Path(SAVE_CLIENT_PATH).exists()
-    server_hash = info["hash"]
-    server_size = info["size"]
-    server_sig = info.get("signature")
-    if not server_sig:
-        logger.error("Сервер не прислал подпись. Отказано в доступе.")
-        return not Path(SAVE_CLIENT_PATH).exists()
+    server_hash = entry["sha256"]
+    server_size = entry["size"]
     p = Path(SAVE_CLIENT_PATH)
     if not p.exists():
         logger.info("Клиент отсутствует, требуется скачивание.")
@@ -216,16 +548,13 @@ def check_client():
         if local_size != server_size:
             logger.info("Размер отличается, требуется обновление.")
             return True
-        local_hash = compute_file_hash(str(p))
+        local_hash = cached_file_hash(p)
         if not local_hash:
             logger.error("Не удалось вычислить локальный хэш.")
             return True
         if local_hash != server_hash:
             logger.info("Хэш не совпадает, требуется обновление.")
             return True
-        if not verify_signature(PUB_KEY_PEM, server_hash.encode(), server_sig):
-            logger.error("Подпись метаданных не валидна.")
-            return False
         logger.info("Локальный клиент актуален.")
         return False
     except Exception as e:
@@ -233,62 +562,335 @@ def check_client():
         return True
 
 
-def download_client():
-    """Скачивание и валидация клиента (с .part и атомарной заменой)."""
-    info = get_client_info()
-    if not info:
-        logger.error("Невозможно получить метаданные сервера.")
-        return False
-    server_hash = info["hash"]
-    server_size = info["size"]
-    server_sig = info.get("signature")
-    if not server_sig:
-        logger.error("Сервер не предоставил подпись. Отказано в доступе.")
-        return False
-    logger.info("Скачивание клиента...")
-    r = safe_request(CLIENT_DOWNLOAD_URL, timeout=30)
-    if not r or r.status_code != 200:
-        logger.error("Не удалось скачать файл.")
-        return False
-    tmp_path = Path(CLIENT_TMP_PATH)
+def discard_part(tmp_path):
+    """Удаляет недокачанный файл вместе с его валидатором."""
+    for path in (Path(tmp_path), Path(tmp_path + ".etag")):
+        try:
+            path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+
+def download_to_part(url, tmp_path, etag, expected_size):
+    """
+    Скачивает артефакт в .part с докачкой: если от прошлой попытки остался
+    кусок той же версии (валидатор в .part.etag), запрашивает остаток через
+    Range + If-Range. Сервер сам отдаст файл целиком (200), если версия сменилась.
+    Новая загрузка идёт сжатой (zstd/gzip, если поддерживает urllib3) и
+    распаковывается на лету, поэтому в .part всегда лежат исходные байты.
+    sha256 считается по тем же чанкам, что пишутся на диск; загрузка
+    прерывается, как только данных становится больше expected_size.
+    Возвращает hex-дайджест скачанного файла или None.
+    """
+    tmp = Path(tmp_path)
+    etag_path = Path(tmp_path + ".etag")
+    offset = 0
+    if tmp.exists():
+        try:
+            stored_etag = etag_path.read_text().strip() if etag_path.exists() else None
+            part_size = tmp.stat().st_size
+        except Exception:
+            stored_etag, part_size = None, 0
+        if stored_etag == etag and 0 < part_size < expected_size:
+            offset = part_size
+        else:
+            discard_part(tmp_path)
+    headers = {"Accept-Encoding": ACCEPT_ENCODING}
+    if offset:
+        headers["Accept-Encoding"] = "identity"
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = etag
+        logger.info(f"Докачка с {offset} байт из {expected_size}.")
+    r = transport.get(url, headers=headers, stream=True, retry=DOWNLOAD_RETRY,
+                      read_timeout=DOWNLOAD_READ_TIMEOUT)
+    if r is None:
+        return None
+    with r:
+        sha256 = hashlib.sha256()
+        if r.status_code == 206 and offset:
+            content_range = r.headers.get("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+                logger.error(f"Неожиданный Content-Range: {content_range}")
+                discard_part(tmp_path)
+                return None
+            try:
+                with open(tmp, "rb") as f:
+                    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать частичный файл: {e}")
+                discard_part(tmp_path)
+                return None
+            mode = "ab"
+        elif r.status_code == 200:
+            offset = 0
+            mode = "wb"
+        else:
+            logger.error(f"Сервер ответил {r.status_code} на скачивание.")
+            if r.status_code == 416:
+                discard_part(tmp_path)
+            return None
+        content_length = r.headers.get("Content-Length", "")
+        if ("Content-Encoding" not in r.headers and content_length.isdigit()
+                and offset + int(content_length) > expected_size):
+            logger.error(f"Сервер отдаёт {content_length} байт, ожидалось {expected_size - offset}.")
+            return None
+        written = offset
+        try:
+            etag_path.write_text(etag)
+            with open(tmp, mode) as f:
+                for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    written += len(chunk)
+                    if written > expected_size:
+                        logger.error(f"Загрузка превысила заявленный размер {expected_size} байт.")
+                        discard_part(tmp_path)
+                        return None
+                    sha256.update(chunk)
+                    f.write(chunk)
+        except Exception as e:
+            logger.error(f"Загрузка прервана, частичный файл сохранён для докачки: {e}")
+            return None
+    return sha256.hexdigest()
+
+
+def fetch_via_patch(entry, base_path, tmp_path):
+    """
+    Собирает новую версию из локальной (base_path) по bsdiff-патчу с сервера.
+    Результат проверяется по sha256 из подписанного манифеста.
+    Файлы крупнее MAX_PATCH_FILE_SIZE не патчатся: совпадающие части
+    они берут из локальной копии по чанкам, не загружая файл в память.
+    Возвращает hex-дайджест собранного файла или None.
+    """
+    if bsdiff4 is None or not entry.get("patch_url") or not Path(base_path).exists():
+        return None
+    try:
+        base_size = Path(base_path).stat().st_size
+    except OSError:
+        return None
+    if max(base_size, entry["size"]) > MAX_PATCH_FILE_SIZE:
+        return None
+    base_hash = cached_file_hash(base_path)
+    if not base_hash or base_hash == entry["sha256"]:
+        return None
+    r = transport.get(entry["patch_url"], params={"from": base_hash, "to": entry["sha256"]},
+                      retry=DOWNLOAD_RETRY, read_timeout=DOWNLOAD_READ_TIMEOUT)
+    if r is None or r.status_code != 200:
+        logger.info("Патч недоступен, скачиваю файл целиком.")
+        return None
+    if len(r.content) >= entry["size"]:
+        return None
     try:
-        tmp_path.write_bytes(r.content)
+        with open(base_path, "rb") as f:
+            data = bsdiff4.patch(f.read(), r.content)
+    except Exception as e:
+        logger.error(f"Не удалось применить патч: {e}")
+        return None
+    digest = hashlib.sha256(data).hexdigest()
+    if len(data) != entry["size"] or digest != entry["sha256"]:
+        logger.error("Результат патча не совпадает с манифестом, скачиваю файл целиком.")
+        return None
+    discard_part(tmp_path)
+    try:
+        Path(tmp_path).write_bytes(data)
     except Exception as e:
         logger.error(f"Не удалось сохранить временный файл: {e}")
+        discard_part(tmp_path)
+        return None
+    logger.info(f"Новая версия собрана из патча ({len(r.content)} байт вместо {entry['size']}).")
+    return digest
+
+
+def get_chunk_list(entry):
+    """
+    Список sha256 чанков артефакта. Доверяем ему, только если его Merkle-корень
+    совпадает с корнем из подписанного манифеста.
+    """
+    r = transport.get(entry["chunks_url"], retry=POLL_RETRY)
+    if r is None or r.status_code != 200:
+        return None
+    try:
+        data = r.json()
+        chunks = [bytes.fromhex(h) for h in data["chunks"]]
+    except Exception as e:
+        logger.error(f"Некорректный список чанков: {e}")
+        return None
+    chunk_size = entry["chunk_size"]
+    expected_count = max(1, -(-entry["size"] // chunk_size))
+    if data.get("chunk_size") != chunk_size or len(chunks) != expected_count:
+        logger.error("Список чанков не соответствует манифесту.")
+        return None
+    if merkle_root(chunks) != entry["merkle_root"]:
+        logger.error("Merkle-корень чанков не совпадает с подписанным манифестом.")
+        return None
+    return chunks
+
+
+def fetch_chunked(entry, tmp_path, base_path=None):
+    """
+    Собирает артефакт по чанкам: берёт уже проверенные чанки из .part той же
+    версии и совпадающие чанки локальной копии (base_path), остальные качает
+    параллельными Range-запросами, проверяя каждый чанк по его хэшу и
+    перекачивая только повреждённые. Целостность файла следует из подписанного
+    Merkle-корня, поэтому возвращается sha256 из манифеста. None — чанки
+    недоступны (качать потоком), False — не все чанки скачаны: .part оставлен
+    для докачки чанками в следующем цикле.
+    """
+    if not entry.get("chunks_url") or not entry.get("merkle_root"):
+        return None
+    etag = f'"{entry["sha256"]}"'
+    tmp = Path(tmp_path)
+    etag_path = Path(tmp_path + ".etag")
+    try:
+        part_valid = tmp.exists() and etag_path.read_text().strip() == etag
+    except Exception:
+        part_valid = False
+    has_base = base_path is not None and Path(base_path).exists()
+    if not part_valid and not has_base:
+        return None
+    chunks = get_chunk_list(entry)
+    if chunks is None:
+        return None
+    size = entry["size"]
+    chunk_size = entry["chunk_size"]
+    if not part_valid:
+        discard_part(tmp_path)
+    pending = []
+    reused = 0
+    try:
+        etag_path.write_text(etag)
+        out = open(tmp, "r+b" if tmp.exists() else "w+b")
+    except Exception as e:
+        logger.error(f"Не удалось подготовить временный файл: {e}")
+        return None
+    with out:
+        out.truncate(size)
+        base = open(base_path, "rb") if has_base else None
         try:
-            tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+            for index, expected in enumerate(chunks):
+                offset = index * chunk_size
+                length = min(chunk_size, size - offset)
+                if part_valid:
+                    out.seek(offset)
+                    if hashlib.sha256(out.read(length)).digest() == expected:
+                        continue
+                if base is not None:
+                    base.seek(offset)
+                    data = base.read(length)
+                    if len(data) == length and hashlib.sha256(data).digest() == expected:
+                        out.seek(offset)
+                        out.write(data)
+                        reused += 1
+                        continue
+                pending.append((index, offset, length, expected))
+        finally:
+            if base is not None:
+                base.close()
+        lock = threading.Lock()
+
+        def fetch_chunk(item):
+            index, offset, length, expected = item
+            headers = {
+                "Accept-Encoding": "identity",
+                "Range": f"bytes={offset}-{offset + length - 1}",
+                "If-Range": etag,
+            }
+            for attempt in range(1, CHUNK_RETRIES + 1):
+                r = transport.get(entry["url"], headers=headers, stream=True,
+                                  retry=DOWNLOAD_RETRY, read_timeout=DOWNLOAD_READ_TIMEOUT)
+                if r is None:
+                    return False
+                with r:
+                    if r.status_code != 206:
+                        logger.error(f"Чанк {index}: сервер ответил {r.status_code}.")
+                        return False
+                    try:
+                        data = r.content
+                    except Exception as e:
+                        logger.warning(f"Чанк {index} прерван: {e}")
+                        continue
+                if len(data) == length and hashlib.sha256(data).digest() == expected:
+                    with lock:
+                        out.seek(offset)
+                        out.write(data)
+                    return True
+                logger.warning(f"Чанк {index} повреждён, перекачиваю ({attempt}/{CHUNK_RETRIES}).")
+            return False
+
+        with ThreadPoolExecutor(max_workers=PARALLEL_DOWNLOADS) as pool:
+            results = list(pool.map(fetch_chunk, pending))
+    logger.info(
+        f"Чанков: {len(chunks)}, взято локально: {reused}, "
+        f"скачано: {sum(results)} из {len(pending)}."
+    )
+    if not all(results):
+        logger.error("Не все чанки загружены, проверенные сохранены для докачки.")
         return False
-    try:
-        if not tmp_path.exists():
-            logger.error("Временный файл отсутствует после записи.")
+    return entry["sha256"]
+
+
+def fetch_artifact(entry, tmp_path, min_size=0, base_path=None):
+    """
+    Получает артефакт из манифеста в tmp_path и проверяет размер и sha256.
+    Порядок: патч от base_path, чанки (если есть что взять из base_path или
+    .part), затем сжатый потоковый download с докачкой. Если чанки скачались
+    не все, потоковый download не запускается: он выбросил бы .part полного
+    размера вместе с проверенными чанками.
+    """
+    server_hash = entry["sha256"]
+    server_size = entry["size"]
+    local_hash = fetch_via_patch(entry, base_path, tmp_path) if base_path is not None else None
+    if local_hash is None:
+        local_hash = fetch_chunked(entry, tmp_path, base_path)
+        if local_hash is False:
             return False
-        local_size = tmp_path.stat().st_size
+    if local_hash is None:
+        local_hash = download_to_part(
+            entry["url"], tmp_path, f'"{server_hash}"', server_size
+        )
+    if local_hash is None:
+        logger.error("Не удалось скачать файл.")
+        return False
+    tmp = Path(tmp_path)
+    try:
+        local_size = tmp.stat().st_size
     except Exception as e:
         logger.error(f"Ошибка проверки размера: {e}")
-        try:
-            tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+        discard_part(tmp_path)
         return False
-    if local_size < MIN_CLIENT_SIZE:
+    if local_size < min_size:
         logger.error(f"Файл слишком мал ({local_size} байт).")
-        tmp_path.unlink(missing_ok=True)
+        discard_part(tmp_path)
         return False
     if local_size != server_size:
         logger.error(f"Размер не совпадает ({local_size} vs {server_size}). Удаляю временный файл.")
-        tmp_path.unlink(missing_ok=True)
+        discard_part(tmp_path)
         return False
-    local_hash = compute_file_hash(str(tmp_path))
-    if not local_hash or local_hash != server_hash:
+    if local_hash != server_hash:
         logger.error("Хэш не совпадает, файл повреждён. Удаляю временный файл.")
-        tmp_path.unlink(missing_ok=True)
+        discard_part(tmp_path)
         return False
-    if not verify_signature(PUB_KEY_PEM, server_hash.encode(), server_sig):
-        logger.error("Проверка цифровой подписи не пройдена! Удаляю временный файл.")
-        tmp_path.unlink(missing_ok=True)
+    Path(tmp_path + ".etag").unlink(missing_ok=True)
+    return True
+
+
+def download_client(entry):
+    """Скачивание и валидация клиента (с .part, докачкой и атомарной заменой)."""
+    return stage_client(entry) and install_client(entry)
+
+
+def stage_client(entry):
+    """Скачивает и проверяет новую версию в .part, не трогая установленный клиент."""
+    if not entry:
+        logger.error("Невозможно получить метаданные сервера.")
         return False
+    logger.info("Скачивание клиента...")
+    return fetch_artifact(entry, CLIENT_TMP_PATH, min_size=MIN_CLIENT_SIZE,
+                          base_path=SAVE_CLIENT_PATH)
+
+
+def install_client(entry):
+    """Атомарно заменяет клиент проверенной версией из .part (старая сохраняется в .bak)."""
+    tmp_path = Path(CLIENT_TMP_PATH)
     try:
         final_path = Path(SAVE_CLIENT_PATH)
         if final_path.exists():
@@ -300,6 +902,7 @@ def download_client():
             except Exception:
                 pass
         tmp_path.replace(final_path)
+        remember_file_hash(final_path, entry["sha256"])
     except Exception as e:
         logger.error(f"Не удалось установить новый клиент: {e}")
         try:
@@ -311,96 +914,196 @@ def download_client():
     return True
 
 
-class ClientRunner(threading.Thread):
-    """Запуск клиента в фоне и мониторинг."""
+def run_in_thread(func, *args):
+    """
+    Выполняет блокирующую функцию (HTTP, хэширование) в daemon-потоке и возвращает future.
+    Daemon-поток не задерживает выход loader, даже если запрос ещё висит в long-poll.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def resolve(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(resolve, result, error)
+        except RuntimeError:
+            pass
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+def report_crash_loop(exit_code, restarts):
+    """Сообщает серверу, что клиент падает сразу после запуска."""
+    client_hash = cached_file_hash(SAVE_CLIENT_PATH) if Path(SAVE_CLIENT_PATH).exists() else None
+    r = transport.post("/loader_report", json={
+        "client_id": get_client_id(),
+        "event": "crash_loop",
+        "exit_code": exit_code,
+        "restarts": restarts,
+        "client_sha256": client_hash,
+        "loader_version": LOADER_VERSION,
+    })
+    if r is None or r.status_code != 200:
+        logger.warning("Не удалось отправить отчёт о crash loop.")
+
+
+class ClientSupervisor:
+    """
+    Запуск клиента в фоне и мониторинг в event loop loader.
+    Падения перезапускаются с экспоненциальной паузой; серия быстрых падений
+    считается crash loop и один раз сообщается серверу. Остановка и установка
+    новой версии прерывают любое ожидание сразу.
+    """
     def __init__(self, exe_path):
-        super().__init__(daemon=True)
         self.exe_path = exe_path
         self.proc = None
-        self._stop = threading.Event()
+        self._terminating = None
+        self.failures = 0
+        self._wake = asyncio.Event()
+        self._held = False
+        self._stopping = False
+        self._reported = False
+        self._reports = set()
+
+    async def _spawn(self):
+        kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+        if platform.system() == "Windows":
+            kwargs["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+        else:
+            kwargs["start_new_session"] = True
+        return await asyncio.create_subprocess_exec(self.exe_path, **kwargs)
 
-    def run(self):
+    async def _sleep(self, delay):
+        """Пауза, которую прерывают stop(), hold() и release()."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _restart_delay(self, exit_code, uptime):
+        if uptime >= CLIENT_STABLE_UPTIME:
+            self.failures = 0
+            self._reported = False
+        self.failures += 1
+        delay = min(CLIENT_RESTART_MAX_DELAY,
+                    CLIENT_MONITOR_RESTART_DELAY * 2 ** (self.failures - 1))
+        if self.failures >= CRASH_LOOP_THRESHOLD and not self._reported:
+            self._reported = True
+            logger.error(f"Crash loop: клиент упал {self.failures} раз подряд, сообщаю серверу.")
+            task = asyncio.ensure_future(run_in_thread(report_crash_loop, exit_code, self.failures))
+            self._reports.add(task)
+            task.add_done_callback(self._reports.discard)
+        return delay
+
+    async def run(self):
         logger.info("Запуск мониторинга клиента.")
-        while not self._stop.is_set():
+        while True:
+            # Флаги меняются только вместе с _wake.set(), поэтому сброс перед проверкой ничего не теряет
+            self._wake.clear()
+            if self._stopping:
+                return
+            if self._held:
+                await self._wake.wait()
+                continue
             if not Path(self.exe_path).exists():
                 logger.error("Клиент отсутствует, ожидаю установки...")
-                time.sleep(CHECK_INTERVAL)
+                await self._sleep(CHECK_INTERVAL)
                 continue
+            started = time.monotonic()
             try:
                 logger.info(f"Запуск клиента: {self.exe_path}")
-                if platform.system() == "Windows":
-                    CREATE_NO_WINDOW = 0x08000000
-                    self.proc = subprocess.Popen(
-                        [self.exe_path],
-                        creationflags=CREATE_NO_WINDOW,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL
-                    )
-                else:
-                    self.proc = subprocess.Popen(
-                        [self.exe_path],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL,
-                        preexec_fn=os.setsid,
-                        close_fds=True
-                    )
+                self.proc = await self._spawn()
             except Exception as e:
-                logger.error(f"Не удалось запустить клиент: {e}")
-                time.sleep(CLIENT_MONITOR_RESTART_DELAY)
+                delay = self._restart_delay(None, 0)
+                logger.error(f"Не удалось запустить клиент: {e}. Повтор через {delay:.0f}s.")
+                await self._sleep(delay)
                 continue
-            try:
-                rc = self.proc.wait()
-                logger.warning(f"Клиент завершился с кодом {rc}. Перезапуск через {CLIENT_MONITOR_RESTART_DELAY}s.")
-            except Exception as e:
-                logger.error(f"Ошибка ожидания клиента: {e}")
-            time.sleep(CLIENT_MONITOR_RESTART_DELAY)
+            exited = asyncio.ensure_future(self.proc.wait())
+            woken = asyncio.ensure_future(self._wake.wait())
+            await asyncio.wait({exited, woken}, return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            if not exited.done():
+                await self._terminate()
+                await exited
+                continue
+            delay = self._restart_delay(exited.result(), time.monotonic() - started)
+            logger.warning(f"Клиент завершился с кодом {exited.result()}. Перезапуск через {delay:.0f}s.")
+            await self._sleep(delay)
 
-    def stop(self):
-        self._stop.set()
+    async def _terminate(self):
+        proc = self.proc
+        if proc is None or proc.returncode is not None:
+            return
+        if self._terminating is proc:
+            await proc.wait()
+            return
+        self._terminating = proc
+        logger.info("Останавливаем процесс клиента...")
         try:
-            if self.proc and self.proc.poll() is None:
-                logger.info("Останавливаем процесс клиента...")
-                self.proc.terminate()
-                try:
-                    self.proc.wait(timeout=5)
-                except Exception:
-                    self.proc.kill()
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), 5)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        except ProcessLookupError:
+            pass
         except Exception as e:
             logger.debug(f"Ошибка при остановке клиента: {e}")
 
+    async def hold(self):
+        """Останавливает клиент и не перезапускает его до release()."""
+        self._held = True
+        self._wake.set()
+        await self._terminate()
 
-def get_loader_info():
-    """Автообновление loader (best-effort)."""
-    r = safe_request(LOADER_INFO_URL)
-    if not r:
-        return None
-    try:
-        info = r.json()
-        required = {"filename", "hash", "size", "signature", "version"}
-        if not all(k in info for k in required):
-            logger.error("Ответ /loader_info неполный.")
-            return None
-        return info
-    except Exception as e:
-        logger.error(f"Ошибка парсинга /loader_info: {e}")
-        return None
+    def release(self):
+        """Снимает удержание и сразу запускает клиент (после установки — без накопленной паузы)."""
+        self._held = False
+        self.failures = 0
+        self._reported = False
+        self._wake.set()
+
+    @asynccontextmanager
+    async def held(self):
+        await self.hold()
+        try:
+            yield
+        finally:
+            self.release()
 
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        await self._terminate()
 
-def check_loader_update():
+
+def check_loader_update(entry):
     """Проверяет, есть ли новая версия загрузчика на сервере."""
-    info = get_loader_info()
-    if not info:
+    if not entry:
         logger.info("Нет данных об обновлении loader.")
         return False
-    server_version = info["version"]
-    server_hash = info["hash"]
+    server_version = entry["version"]
+    server_hash = entry["sha256"]
     if server_version == LOADER_VERSION:
         logger.info("Версия загрузчика совпадает. Дополнительно проверяю целостность.")
         local_path = Path(sys.argv[0]).resolve()
         if not local_path.exists():
             logger.warning("Файл загрузчика отсутствует. Обновляем.")
             return True
-        local_hash = compute_file_hash(str(local_path))
+        local_hash = cached_file_hash(local_path)
         if not local_hash or local_hash != server_hash:
             logger.warning("Файл загрузчика поврежден или хэш не совпадает — обновляем.")
             return True
@@ -410,52 +1113,23 @@ def check_loader_update():
     return True
 
 
-def download_loader_update():
+def download_loader_update(entry):
     """
-    Скачивает новый loader, проверяет hash+signature и запускает апдейтер-скрипт.
+    Скачивает новый loader, проверяет hash из подписанного манифеста и запускает апдейтер-скрипт.
     """
-    info = get_loader_info()
-    if not info:
+    if not entry:
         logger.info("Нет информации об обновлении loader.")
         return False
-    new_hash = info["hash"]
-    new_size = info["size"]
-    new_sig = info["signature"]
-    new_version = info.get("version")
+    new_version = entry.get("version")
     logger.info(f"Обновление loader: версия {new_version}")
-    r = safe_request(LOADER_DOWNLOAD_URL, timeout=30)
-    if not r or r.status_code != 200:
+    if not fetch_artifact(entry, LOADER_TMP_PATH, base_path=Path(sys.argv[0]).resolve()):
         logger.error("Не удалось скачать новый loader.")
         return False
     tmp_path = Path(LOADER_TMP_PATH)
-    try:
-        tmp_path.write_bytes(r.content)
-    except Exception as e:
-        logger.error(f"Не удалось записать временный loader: {e}")
-        tmp_path.unlink(missing_ok=True)
-        return False
-    try:
-        size = tmp_path.stat().st_size
-        if size != new_size:
-            logger.error("Размер нового loader не совпадает.")
-            tmp_path.unlink(missing_ok=True)
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка проверки размера: {e}")
-        tmp_path.unlink(missing_ok=True)
-        return False
-    h = compute_file_hash(str(tmp_path))
-    if not h or h != new_hash:
-        logger.error("Хэш нового loader не совпадает.")
-        tmp_path.unlink(missing_ok=True)
-        return False
-    if not verify_signature(PUB_KEY_PEM, new_hash.encode(), new_sig):
-        logger.error("Проверка подписи нового loader не пройдена.")
-        tmp_path.unlink(missing_ok=True)
-        return False
     try:
         cur_exe = Path(sys.argv[0]).resolve()
         tmp = tmp_path.resolve()
+        remember_file_hash(cur_exe, entry["sha256"], stat_path=tmp)
         if platform.system() == "Windows":
             bat = BASE_DIR / "update_loader.bat"
             with open(bat, "w", encoding="utf-8") as f:
@@ -507,73 +1181,139 @@ def download_loader_update():
         return False
 
 
-def main_loop():
-    if not acquire_pidfile():
+async def update_client(supervisor, entry):
+    """Скачивает новую версию рядом с работающим клиентом и останавливает его только на установку."""
+    if Path(SAVE_CLIENT_PATH).exists():
+        local_hash = await run_in_thread(cached_file_hash, SAVE_CLIENT_PATH)
+        if local_hash == entry["sha256"]:
+            return
+        logger.info("Найдена новая версия клиента, обновляем.")
+    else:
+        logger.warning("Клиент отсутствует локально. Пробую загрузить.")
+    if not await run_in_thread(stage_client, entry):
+        logger.error("Не удалось загрузить клиента. Повторим позже.")
         return
-    client_runner = ClientRunner(SAVE_CLIENT_PATH)
+    async with supervisor.held():
+        installed = await run_in_thread(install_client, entry)
+    if installed:
+        logger.info("Клиент обновлён и перезапущен.")
+    else:
+        logger.error("Не удалось обновить клиента.")
+
+
+async def update_loader(manifest):
+    """True — запущен апдейтер, loader должен завершиться."""
+    logger.info("Проверяем обновление loader...")
     try:
-        logger.info("Проверяем обновление loader...")
+        loader_entry = manifest.get("loader")
+        if await run_in_thread(check_loader_update, loader_entry):
+            logger.info("Найдена новая версия loader. Попытка загрузки и запуска апдейтера.")
+            if await run_in_thread(download_loader_update, loader_entry):
+                return True
+            logger.error("Не удалось загрузить/установить обновление loader.")
+    except Exception as e:
+        logger.debug(f"Ошибка при проверке обновления loader: {e}")
+    return False
+
+
+async def update_loop(supervisor, shutdown, checked=None):
+    """
+    Проверка обновлений (long-poll манифеста) параллельно с работой клиента.
+    Loader проверяется при каждом новом манифесте (checked — уже проверенный),
+    клиент — на каждом цикле, чтобы неудачная загрузка повторялась.
+    Между запросами выдерживается интервал сервера (max-age) с разбросом, а срок
+    ожидания long-poll случайно укорачивается — loader'ы не опрашивают синхронно.
+    """
+    while True:
+        started = time.monotonic()
         try:
-            if check_loader_update():
-                logger.info("Найдена новая версия loader. Попытка загрузки и запуска апдейтера.")
-                if download_loader_update():
+            # Первый запрос без ожидания: после быстрого старта сверяемся с сервером сразу
+            wait = round(LONG_POLL_WAIT * random.uniform(1 - CHECK_JITTER, 1)) if checked else 0
+            manifest = await run_in_thread(get_manifest, wait)
+            if manifest and manifest is not checked:
+                if checked:
+                    # Long-poll разбудил всех сразу: не качаем сборку одновременно с остальными
+                    await asyncio.sleep(random.uniform(0, UPDATE_SPREAD))
+                checked = manifest
+                if await update_loader(manifest):
+                    shutdown.set()
                     return
-                else:
-                    logger.error("Не удалось загрузить/установить обновление loader.")
+            entry = manifest.get("client") if manifest else None
+            if entry:
+                await update_client(supervisor, entry)
         except Exception as e:
-            logger.debug(f"Ошибка при проверке обновления loader: {e}")
-    except Exception as e:
-        logger.debug(f"Неожиданная ошибка при стартовой проверке loader: {e}")
-    client_runner = ClientRunner(SAVE_CLIENT_PATH)
-    try:
+            logger.error(f"Ошибка в основном цикле: {e}")
+        # Ожидание long-poll засчитывается в интервал; сервер без long-poll или ошибка
+        # отвечают сразу — тогда ждём интервал целиком
+        delay = next_poll_delay() - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def local_client_verified(manifest):
+    """Локальный клиент совпадает с записью подписанного манифеста."""
+    entry = manifest.get("client") if manifest else None
+    if not entry or not Path(SAVE_CLIENT_PATH).exists():
+        return False
+    return await run_in_thread(cached_file_hash, SAVE_CLIENT_PATH) == entry["sha256"]
+
+
+async def run_loader():
+    # Быстрый старт: клиент уже совпадает с последним проверенным манифестом,
+    # поэтому запускаем его сразу, а сверку с сервером и обновления — в фоне
+    manifest = await run_in_thread(load_cached_manifest)
+    if await local_client_verified(manifest):
+        logger.info("Клиент совпадает с сохранённым манифестом, запускаю не дожидаясь сервера.")
+        checked = None
+    else:
+        manifest = await run_in_thread(get_manifest) or {}
+        if await update_loader(manifest):
+            return
         try:
-            need_download = check_client()
-            if need_download:
-                ok = download_client()
-                if not ok:
-                    logger.error(f"Не удалось скачать клиент. Повтор через {CHECK_INTERVAL}s.")
-                    time.sleep(CHECK_INTERVAL)
-                    return
+            client_entry = manifest.get("client")
+            if await run_in_thread(check_client, client_entry):
+                if not await run_in_thread(download_client, client_entry):
+                    logger.error("Не удалось скачать клиент, повторю в фоне.")
         except Exception as e:
             logger.error(f"Ошибка при проверке/скачивании клиента: {e}")
-        client_runner.start()
-        while True:
-            try:
-                info = get_client_info()
-                if info:
-                    server_hash = info["hash"]
-                    if Path(SAVE_CLIENT_PATH).exists():
-                        local_hash = compute_file_hash(SAVE_CLIENT_PATH)
-                        if local_hash != server_hash:
-                            logger.info("Найдена новая версия клиента, обновляем.")
-                            client_runner.stop()
-                            client_runner.join(timeout=5)
-                            if download_client():
-                                client_runner = ClientRunner(SAVE_CLIENT_PATH)
-                                client_runner.start()
-                                logger.info("Клиент обновлён и перезапущен.")
-                            else:
-                                logger.error("Не удалось обновить клиента.")
-                                client_runner = ClientRunner(SAVE_CLIENT_PATH)
-                                client_runner.start()
-                    else:
-                        logger.warning("Клиент отсутствует локально. Пробую загрузить.")
-                        if download_client():
-                            logger.info("Клиент загружен. Запускаю мониторинг.")
-                            client_runner = ClientRunner(SAVE_CLIENT_PATH)
-                            client_runner.start()
-                        else:
-                            logger.error("Не удалось загрузить клиента. Повторим позже.")
-            except Exception as e:
-                logger.error(f"Ошибка в основном цикле: {e}")
-            time.sleep(CHECK_INTERVAL)
-    finally:
+        checked = manifest or None
+
+    supervisor = ClientSupervisor(SAVE_CLIENT_PATH)
+    shutdown = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (getattr(signal, "SIGTERM", None), getattr(signal, "SIGINT", None)):
         try:
-            client_runner.stop()
-        except Exception:
-            pass
+            loop.add_signal_handler(sig, shutdown.set)
+        except (NotImplementedError, RuntimeError, TypeError, ValueError):
+            pass  # Windows: Ctrl+C приходит как KeyboardInterrupt
+    tasks = [
+        asyncio.create_task(supervisor.run()),
+        asyncio.create_task(update_loop(supervisor, shutdown, checked)),
+        asyncio.create_task(shutdown.wait()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception():
+                logger.error(f"Непредвиденная ошибка в loader: {task.exception()}")
+    finally:
+        logger.info("Остановка loader...")
+        transport.close()
+        await supervisor.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main_loop():
+    if not acquire_pidfile():
+        return
+    try:
+        asyncio.run(run_loader())
+    finally:
         release_pidfile()
 
+
 if __name__ == "__main__":
     try:
         main_loop()
@@ -4,6 +4,7 @@ import os
 import platform
 import signal
 import uuid
+from urllib.parse import urlencode
 import websockets
 from utils import system
 from utils.logger import setup_logger
@@ -12,6 +13,10 @@ logger = setup_logger(log=True, files=False)
 
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
 DEFAULT_SERVER_URL = "ws://127.0.0.1:1337/ws/"
+CLIENT_VERSION = "1"
+# Пока сервер не прислал hello со своими значениями
+DEFAULT_HEARTBEAT_INTERVAL = 30
+DEFAULT_IDLE_TIMEOUT = 300
 
 COMMANDS = {
     "shutdown": system.shutdown,
@@ -50,18 +55,38 @@ def create_config():
     return config
 
 
-async def heartbeat(websocket):
-    """Периодический пинг для проверки соединения."""
+async def heartbeat(websocket, settings):
+    """
+    Ping/pong control frames с интервалом из hello сервера: без ответа за интервал
+    соединение считается мёртвым. Пустой бинарный кадр реже idle_timeout отмечает
+    клиента активным для сервера, даже если ping/pong замыкает прокси по пути.
+    """
+    loop = asyncio.get_running_loop()
+    last_mark = loop.time()
     while True:
         try:
-            await websocket.send(json.dumps({"command": "ping"}))
-            await asyncio.sleep(30)
+            # hello с новым интервалом прерывает ожидание, отсчёт начинается заново
+            try:
+                await asyncio.wait_for(settings["updated"].wait(), settings["heartbeat_interval"])
+                settings["updated"].clear()
+                continue
+            except asyncio.TimeoutError:
+                pass
+            pong = await websocket.ping()
+            await asyncio.wait_for(pong, settings["heartbeat_interval"])
+            if loop.time() - last_mark >= settings["idle_timeout"] / 3:
+                await websocket.send(b"")
+                last_mark = loop.time()
+        except asyncio.TimeoutError:
+            logger.error('Сервер не ответил на ping, переподключение.')
+            await websocket.close()
+            break
         except Exception as e:
             logger.error(f'Heartbeat error: {e}')
             break
 
 
-async def handle_server_messages(websocket, config):
+async def handle_server_messages(websocket, config, settings):
     async for message in websocket:
         try:
             data = json.loads(message)
@@ -72,6 +97,12 @@ async def handle_server_messages(websocket, config):
         cmd = data.get("command")
         if cmd in ["pong", "ping"]:
             continue
+        if cmd == "hello":
+            for key in ("heartbeat_interval", "idle_timeout"):
+                if isinstance(data.get(key), (int, float)) and data[key] > 0:
+                    settings[key] = data[key]
+            settings["updated"].set()
+            continue
         if cmd == "result" and data.get("cmd") == "update_client_id":
             status = data.get("status")
             if status == "ok":
@@ -107,15 +138,20 @@ async def handle_server_messages(websocket, config):
 async def main():
     config = create_config()
     client_id = config.get("client_id")
-    server_url = config["server_url"] + config["client_id"]
+    # Версия и теги из config.json попадают в индексы сервера (/clients v:1, /clients office)
+    query = urlencode({"version": CLIENT_VERSION, "tags": ",".join(config.get("tags", []))})
+    server_url = config["server_url"] + config["client_id"] + "?" + query
     logger.info(f'Подключаюсь к серверу {server_url}')
     while True:
         try:
-            async with websockets.connect(server_url) as websocket:
+            # Встроенный keepalive выключен: интервал ping задаёт сервер в hello
+            async with websockets.connect(server_url, ping_interval=None) as websocket:
                 logger.info('Соединение с сервером установлено.')
-                hb_task = asyncio.create_task(heartbeat(websocket))
+                settings = {"heartbeat_interval": DEFAULT_HEARTBEAT_INTERVAL,
+                            "idle_timeout": DEFAULT_IDLE_TIMEOUT, "updated": asyncio.Event()}
+                hb_task = asyncio.create_task(heartbeat(websocket, settings))
                 try:
-                    await handle_server_messages(websocket, config)
+                    await handle_server_messages(websocket, config, settings)
                 finally:
                     hb_task.cancel()
         except Exception as e: